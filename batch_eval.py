@@ -0,0 +1,90 @@
+import numpy as np
+
+from board import Board, CELLS, CORDS, DEFAULT_WEIGHTS, DISTANCE_OFFSET, DISTANCES, Space, encode_turn
+
+# Vectorized HeuristicPlayer scoring. Cells are numbered y*5 + x like the bitboards
+# Space.pos_rank and Chebyshev distances indexed by cell
+RANKS = np.array([Space.pos_rank[cord] for cord in CORDS])
+CELL_DISTANCES = np.array([[DISTANCES[cord1][cord2] for cord2 in CORDS] for cord1 in CORDS])
+
+
+def board_heights(board:Board):
+    """Returns the height of every cell as an array of 25"""
+    return np.array([board.get_height(cord) for cord in CORDS])
+
+
+def worker_cells(board:Board):
+    """Returns the cells of workers A, B, Y, Z as an array of 4"""
+    return np.array([CELLS[worker.cord] for pid in (1, 2) for worker in board.get_workers(pid)])
+
+
+def encode_triples(board:Board, pid, triples):
+    """Encodes (worker_id, move, build) triples of pid as board.encode_turn ints"""
+    ids = [worker.id for worker in board.get_workers(pid)]
+    return np.array([encode_turn(ids.index(t[0]), t[1], t[2]) for t in triples], dtype=np.intp)
+
+
+def _score(heights, own1, own2, opp1, opp2, weights, distance_offset):
+    """
+    calc_score of workers standing on cells own1/own2 against opponents on
+    opp1/opp2. heights is gathered with the matching leading dimensions.
+    Standing on level 3 scores infinity whatever the weights, as in
+    HeuristicPlayer.calc_move_score.
+    """
+    c1, c2, c3 = weights
+    height1 = np.take_along_axis(heights, own1[..., None], -1)[..., 0]
+    height2 = np.take_along_axis(heights, own2[..., None], -1)[..., 0]
+
+    center = RANKS[own1] + RANKS[own2]
+    distance = (np.minimum(CELL_DISTANCES[opp1, own1], CELL_DISTANCES[opp1, own2])
+                + np.minimum(CELL_DISTANCES[opp2, own1], CELL_DISTANCES[opp2, own2]))
+    score = (c1*(height1 + height2) + c2*center + c3*(distance_offset - distance)).astype(float)
+    score[(height1 == 3) | (height2 == 3)] = np.inf
+    return score
+
+
+def score_turns(board:Board, pid, turns, weights = DEFAULT_WEIGHTS, distance_offset = DISTANCE_OFFSET):
+    """Scores every encoded turn of pid in one vectorized call"""
+    turns = np.asarray(turns, dtype=np.intp)
+    moving = turns & 1
+    moves = (turns >> 1) & 31
+
+    cells = worker_cells(board)
+    own = cells[0:2] if pid == 1 else cells[2:4]
+    opponents = cells[2:4] if pid == 1 else cells[0:2]
+
+    # The moving worker goes to its move cell, its partner stays put
+    own1 = np.where(moving == 0, moves, own[0])
+    own2 = np.where(moving == 1, moves, own[1])
+    heights = np.broadcast_to(board_heights(board), (len(turns), 25))
+    return _score(heights, own1, own2, opponents[0], opponents[1], weights, distance_offset)
+
+
+def score_triples(board:Board, pid, triples, weights = DEFAULT_WEIGHTS, distance_offset = DISTANCE_OFFSET):
+    """Scores (worker_id, move, build) triples of pid in one vectorized call"""
+    return score_turns(board, pid, encode_triples(board, pid, triples), weights, distance_offset)
+
+
+def best_turn(board:Board, pid, turns, weights = DEFAULT_WEIGHTS, distance_offset = DISTANCE_OFFSET):
+    """
+    Returns the turn HeuristicPlayer._best_turn picks: the first highest
+    scoring one if that score is above 0, otherwise the first turn
+    """
+    scores = score_turns(board, pid, turns, weights, distance_offset)
+    best = int(np.argmax(scores))
+    if scores[best] > 0:
+        return turns[best]
+    return turns[0]
+
+
+def score_positions(heights, cells, pid, weights = DEFAULT_WEIGHTS, distance_offset = DISTANCE_OFFSET):
+    """
+    Scores many positions at once for pid.
+    heights is (N, 25) cell heights and cells is (N, 4) cells of A, B, Y, Z.
+    """
+    heights = np.asarray(heights)
+    cells = np.asarray(cells)
+    own = cells[:, 0:2] if pid == 1 else cells[:, 2:4]
+    opponents = cells[:, 2:4] if pid == 1 else cells[:, 0:2]
+    return _score(heights, own[:, 0], own[:, 1], opponents[:, 0], opponents[:, 1], weights,
+                  distance_offset)
@@ -0,0 +1,189 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from board import BoardAdjacencyIter, CORDS, decode_turn
+from players import HEURISTIC, RANDOM
+from selfplay import HeadlessGame
+
+
+def _midgame(seed, turns = 8):
+    """A HeadlessGame between heuristic players after `turns` seeded random turns"""
+    game = HeadlessGame(HEURISTIC, HEURISTIC, seed)
+    board = game.board
+    rng = random.Random(seed)
+    for turn in range(turns):
+        pid = turn % 2 + 1
+        # Winning turns would end the game
+        choices = [decode_turn(t) for t in board.iter_turns(pid)]
+        choices = [choice for choice in choices if board.get_height(choice[1]) < 3]
+        if not choices:
+            break
+        index, move, build = choices[rng.randrange(len(choices))]
+        board.move(board.get_workers(pid)[index], move)
+        board.build(build)
+    return game
+
+
+def bench_move(game, n):
+    """Board.move of a worker to a free neighbour and back"""
+    board = game.board
+    worker = board.get_workers(1)[0]
+    start = worker.cord
+    target = next(board.iter_moves(start))
+    for _ in range(n):
+        board.move(worker, target)
+        board.move(worker, start)
+    return 2 * n
+
+
+def bench_build(game, n):
+    """Board.build and Board.unbuild on a free space"""
+    board = game.board
+    space = next(board.iter_builds(board.get_workers(1)[0].cord))
+    for _ in range(n):
+        board.build(space)
+        board.unbuild(space)
+    return 2 * n
+
+
+def bench_adjacency(game, n):
+    """BoardAdjacencyIter construction for movement around every space"""
+    board = game.board
+    for _ in range(n):
+        for cord in CORDS:
+            BoardAdjacencyIter(board, cord)
+    return n * len(CORDS)
+
+
+def bench_list_triples(game, n):
+    player = game.players[0]
+    for _ in range(n):
+        player._list_triples()
+    return n
+
+
+def bench_calc_score(game, n):
+    player = game.players[0]
+    cord1, cord2 = (worker.cord for worker in game.board.get_workers(1))
+    for _ in range(n):
+        player.calc_score(cord1, cord2)
+    return n
+
+
+def _games(p1_type, p2_type):
+    def bench(seed, n):
+        for i in range(n):
+            HeadlessGame(p1_type, p2_type, seed + i).run()
+        return n
+    return bench
+
+
+# name -> (function, operations per repeat, whether it plays whole games)
+BENCHMARKS = {
+    "board_move": (bench_move, 20000, False),
+    "board_build_unbuild": (bench_build, 20000, False),
+    "adjacency_iter": (bench_adjacency, 1000, False),
+    "list_triples": (bench_list_triples, 2000, False),
+    "calc_score": (bench_calc_score, 20000, False),
+    "random_game": (_games(RANDOM, RANDOM), 100, True),
+    "heuristic_game": (_games(HEURISTIC, RANDOM), 50, True),
+}
+
+
+def _game_memory(bench, seed):
+    """Peak bytes allocated while playing one game"""
+    tracemalloc.start()
+    try:
+        bench(seed, 1)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(names = None, seed = 0, repeat = 5, scale = 1.0):
+    """
+    Runs each benchmark `repeat` times from the same seeded position and
+    keeps the fastest run. Returns {name: {"ops_per_sec": ..., ...}}.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        bench, count, plays_games = BENCHMARKS[name]
+        count = max(1, int(count * scale))
+        best = 0.0
+        for _ in range(repeat):
+            random.seed(seed)
+            if plays_games:
+                start_time = time.perf_counter()
+                ops = bench(seed, count)
+            else:
+                game = _midgame(seed)
+                start_time = time.perf_counter()
+                ops = bench(game, count)
+            best = max(best, ops / (time.perf_counter() - start_time))
+
+        results[name] = {"ops_per_sec": best}
+        if plays_games:
+            results[name]["bytes_per_game"] = _game_memory(bench, seed)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns (name, old, new) for every benchmark more than threshold slower than baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]["ops_per_sec"]
+        new = result["ops_per_sec"]
+        if new < old * (1 - threshold):
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Santorini board, player and game speed")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per benchmark, the fastest is kept")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for operations per run")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="fraction slower than the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.only, args.seed, args.repeat, args.scale)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+
+    for name, result in results.items():
+        line = f"{name:22}{result['ops_per_sec']:14.0f} ops/sec"
+        if "bytes_per_game" in result:
+            line += f"{result['bytes_per_game'] / 1024:10.1f} KiB/game"
+        if baseline and name in baseline:
+            line += f"  ({result['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1:+.1%})"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"python": platform.python_version(), "seed": args.seed,
+                       "results": results}, file, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.0f} -> {new:.0f} ops/sec")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
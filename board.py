@@ -1,23 +1,100 @@
 # from memento import Caretaker, TurnMemento
+import random
+from array import array
+
+# Cell i of a bitboard is the space at (i // 5, i % 5)
+BITS = {(y, x): 1 << (y*5 + x) for y in range(5) for x in range(5)}
+CELLS = {(y, x): y*5 + x for y in range(5) for x in range(5)}
+CORDS = [(i // 5, i % 5) for i in range(25)]
+
+
+def encode_turn(index, move, build):
+    """
+    Packs a turn into an int: the worker's index in its player's pair (bit 0),
+    the move space (bits 1-5) and the build space (bits 6-10)
+    """
+    return index | CELLS[move] << 1 | CELLS[build] << 6
+
+
+def decode_turn(turn):
+    """Unpacks a turn into (worker index, move space, build space)"""
+    return turn & 1, CORDS[(turn >> 1) & 31], CORDS[turn >> 6]
+
+
+def _neighbors(cord):
+    """(space, bit) pairs adjacent to cord, in the order moves have always been listed"""
+    adjacent = []
+    for x in range(-1, 2):
+        for y in range(-1, 2):
+            candidate = (cord[0]+y, cord[1]+x)
+            if candidate != cord and candidate in BITS:
+                adjacent.append((candidate, BITS[candidate]))
+    return tuple(adjacent)
+
+
+# Built once at import: the neighbours of every space and their combined mask
+NEIGHBORS = {cord: _neighbors(cord) for cord in BITS}
+NEIGHBOR_MASKS = {cord: sum(bit for _, bit in NEIGHBORS[cord]) for cord in BITS}
+
+# Chebyshev distance between every pair of spaces
+DISTANCES = {cord1: {cord2: max(abs(cord1[0] - cord2[0]), abs(cord1[1] - cord2[1])) for cord2 in BITS}
+             for cord1 in BITS}
+
+# Zobrist keys, seeded so hashes are stable between runs (opening books, saved tables)
+_zobrist_random = random.Random(0x5A4E7041)
+# One key per space and block level (1-4)
+ZOBRIST_BLOCKS = {cord: [_zobrist_random.getrandbits(64) for _ in range(4)] for cord in BITS}
+# One key per worker slot and space; a worker not yet placed hashes to 0
+ZOBRIST_WORKERS = [{None: 0, **{cord: _zobrist_random.getrandbits(64) for cord in BITS}}
+                   for _ in range(4)]
+# Searchers XOR this in when player 2 is to move
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
+
+# Default weights of the (height, center, distance) scores, and the offset a
+# player's distance sum is subtracted from so that being closer scores higher
+DEFAULT_WEIGHTS = (3, 2, 1)
+DISTANCE_OFFSET = 8
+
 
 class Board:
-    """Manages player & worker interactions with the board's spaces"""
+    """Manages player & worker interactions with the board's spaces
 
-    def __init__(self, workers):
-        self._observer = VictoryObserver()
-        self._spaces = [[Space((x,y), self._observer) for x in range(5)] for y in range(5)]
+    The board is stored as bitboards: _levels[k] has bit i set when the
+    space has a block at level k+1, and _worker_masks holds one bit per worker.
+
+    The evaluation terms of each player (height sum, center rank sum and
+    distance to the opponents) are kept up to date on every move and build,
+    indexed by pid, so scoring a position or a candidate move is constant time.
+    """
+
+    def __init__(self, workers, history = 4096, checkpoint_interval = 32):
+        self._levels = [0, 0, 0, 0]
         self._workers = workers
-        self._caretaker = Caretaker(self)
+        self._worker_masks = [0] * len(workers)
+        self._slots = {worker: i for i, worker in enumerate(workers)}
+        self._occupied = 0
+        self._zobrist = 0
+        self._heights = [0, 0, 0]
+        self._centers = [0, 0, 0]
+        self._distances = [0, 0, 0]
+        self._caretaker = Caretaker(self, history, checkpoint_interval)
+        # Called with each encoded turn after Player.take_turn applies it
+        self._turn_hooks = []
 
     def __str__(self):
         """Formats the board"""
         sep = "+--+--+--+--+--+"
         msg = ""
-        for row in self._spaces:
+        for y in range(5):
             msg += sep
             msg += '\n'
-            for space in row:
-                msg += str(space)
+            for x in range(5):
+                bit = BITS[(y, x)]
+                worker = " "
+                for i, mask in enumerate(self._worker_masks):
+                    if mask & bit:
+                        worker = str(self._workers[i])
+                msg += f"|{self._height(bit)}{worker}"
             msg += '|'
             msg += '\n'
         msg += sep
@@ -25,17 +102,67 @@ class Board:
 
     @property
     def running(self):
-        return self._observer.running
+        """False once a worker stands on level 3; true again if that move is undone"""
+        return not self.winner
+
+    @property
+    def winner(self):
+        """pid of the player with a worker on level 3, or 0. Read off the masks, so undo restores it"""
+        masks = self._worker_masks
+        level3 = self._levels[2]
+        if (masks[0] | masks[1]) & level3:
+            return 1
+        if (masks[2] | masks[3]) & level3:
+            return 2
+        return 0
+
+    def result(self, pid):
+        """
+        Winning pid if the game is over with pid to move, else 0: a worker on
+        level 3 has won, and a side to move with no legal turn has lost
+        """
+        winner = self.winner
+        if winner:
+            return winner
+        if not self.has_turn(pid):
+            return 3 - pid
+        return 0
+
+    @property
+    def zobrist(self):
+        """Zobrist hash of the buildings and worker placements, updated incrementally"""
+        return self._zobrist
+
+    @property
+    def turn_hooks(self):
+        return self._turn_hooks
+
+    def add_turn_hook(self, hook):
+        self._turn_hooks.append(hook)
+
+    def remove_turn_hook(self, hook):
+        self._turn_hooks.remove(hook)
+
+    def get_workers(self, pid):
+        """Returns the two workers belonging to player pid"""
+        if pid == 1:
+            return self._workers[0:2]
+        return self._workers[2:4]
+
+    def _height(self, bit):
+        levels = self._levels
+        return (0 if not levels[0] & bit else 1 if not levels[1] & bit
+                else 2 if not levels[2] & bit else 3 if not levels[3] & bit else 4)
 
     def get_height(self, cord):
-        return self._spaces[cord[0]][cord[1]].level
+        return self._height(BITS[cord])
 
     def get_center_score(self, cord):
         return Space.pos_rank[cord]
 
     def get_distance(self, cord1, cord2):
         """Calculating Chebyshev distance between two pieces"""
-        return max(abs(cord1[0] - cord2[0]), abs(cord1[1] - cord2[1]))
+        return DISTANCES[cord1][cord2]
 
     def get_distance_score(self, pid, cord1, cord2):
         """Pass in the worker:pid and the two coordinates."""
@@ -60,37 +187,195 @@ class Board:
 
         return min(dist11, dist12) + min(dist21, dist22)
 
+    def get_scores(self, pid):
+        """(height, center, distance) sums of pid's workers, kept up to date incrementally"""
+        return (self._heights[pid], self._centers[pid], self._distances[pid])
+
+    def get_move_scores(self, worker, new):
+        """(height, center, distance) sums of the worker's player if it stood on new"""
+        slot = self._slots[worker]
+        pid = 1 if slot < 2 else 2
+        old = worker.cord
+
+        height = self._heights[pid] - self._height(self._worker_masks[slot]) + self._height(BITS[new])
+        center = self._centers[pid] - Space.pos_rank[old] + Space.pos_rank[new]
+
+        # Distance from each opponent to the nearer of (new, partner)
+        to_new = DISTANCES[new]
+        to_partner = DISTANCES[self._workers[slot ^ 1].cord]
+        first = 2 if pid == 1 else 0
+        opponent1 = self._workers[first].cord
+        opponent2 = self._workers[first + 1].cord
+        distance = (min(to_new[opponent1], to_partner[opponent1])
+                    + min(to_new[opponent2], to_partner[opponent2]))
+        return (height, center, distance)
+
+    def _update_distances(self):
+        placed = [worker.cord for worker in self._workers]
+        if None in placed:
+            return
+        a, b, y, z = placed
+        to_y = DISTANCES[y]
+        to_z = DISTANCES[z]
+        to_a = DISTANCES[a]
+        to_b = DISTANCES[b]
+        self._distances[1] = min(to_y[a], to_y[b]) + min(to_z[a], to_z[b])
+        self._distances[2] = min(to_a[y], to_a[z]) + min(to_b[y], to_b[z])
+
     def check_heights(self, cord1, cord2):
         """Pass in current coordinates (cord1) and new coordinates (cord2)
         Determines whether the height difference is a valid worker move"""
 
-        space1 = self._spaces[cord1[0]][cord1[1]]
-        space2 = self._spaces[cord2[0]][cord2[1]]
+        height = self._height(BITS[cord1])
 
-        if space2 - space1 < 2:
+        # Moving up at most one level means cord2 has no block at height+2
+        if height >= 3:
             return True
-        return False
+        return not self._levels[height + 1] & BITS[cord2]
 
     def move(self, worker, new):
         """Updates the placement of a worker on the board
         takes the old worker coordinates (x1,y1) and the new coordinates (x2,y2)"""
 
-        if worker.cord != None:
-            y, x = worker.cord
-            self._spaces[y][x].remove_worker()
+        slot = self._slots[worker]
+        bit = BITS[new]
+        keys = ZOBRIST_WORKERS[slot]
+        self._zobrist ^= keys[worker.cord] ^ keys[new]
+
+        pid = 1 if slot < 2 else 2
+        height = self._height(bit)
+        self._heights[pid] += height - self._height(self._worker_masks[slot])
+        self._centers[pid] += Space.pos_rank[new] - Space.pos_rank.get(worker.cord, 0)
 
-        y, x = new
-        self._spaces[y][x].add_worker(worker)
+        self._occupied ^= self._worker_masks[slot] ^ bit
+        self._worker_masks[slot] = bit
         worker.move(new)
+        self._update_distances()
 
     def build(self, cord):
-        self._spaces[cord[0]][cord[1]].build()
+        bit = BITS[cord]
+        level = self._height(bit)
+        self._levels[level] |= bit
+        self._zobrist ^= ZOBRIST_BLOCKS[cord][level]
+        if self._occupied & bit:
+            self._heights[self._owner(bit)] += 1
 
     def unbuild(self, cord):
-        self._spaces[cord[0]][cord[1]].unbuild()
+        bit = BITS[cord]
+        level = self._height(bit) - 1
+        self._levels[level] &= ~bit
+        self._zobrist ^= ZOBRIST_BLOCKS[cord][level]
+        if self._occupied & bit:
+            self._heights[self._owner(bit)] -= 1
+
+    def _owner(self, bit):
+        """pid of the worker standing on bit"""
+        masks = self._worker_masks
+        return 1 if (masks[0] | masks[1]) & bit else 2
 
     def is_unoccupied(self, cord):
-        return self._spaces[cord[0]][cord[1]].is_unoccupied()
+        return not (self._occupied | self._levels[3]) & BITS[cord]
+
+    def build_mask(self):
+        """Bit mask of every space that can be built on (or moved to ignoring height)"""
+        return ~(self._occupied | self._levels[3])
+
+    def move_mask(self, cord):
+        """Bit mask of every space a worker on cord could climb or step down to"""
+        height = self._height(BITS[cord])
+        if height >= 3:
+            return self.build_mask()
+        return ~(self._occupied | self._levels[3] | self._levels[height + 1])
+
+    def iter_moves(self, cord):
+        """Yields the adjacent spaces a worker on cord can move to"""
+        free = self.move_mask(cord)
+        for candidate, bit in NEIGHBORS[cord]:
+            if free & bit:
+                yield candidate
+
+    def iter_builds(self, cord):
+        """Yields the adjacent spaces a worker on cord can build on"""
+        free = self.build_mask()
+        for candidate, bit in NEIGHBORS[cord]:
+            if free & bit:
+                yield candidate
+
+    def iter_turns(self, pid):
+        """
+        Lazily yields every legal turn of pid as an encode_turn int, in the order
+        Player._list_triples has always listed them (second worker first)
+        """
+        free = self.build_mask()
+        workers = self.get_workers(pid)
+        for index in (1, 0):
+            start = workers[index].cord
+            start_cell = CELLS[start] << 6
+            for move in self.iter_moves(start):
+                moved = index | CELLS[move] << 1
+                for build, bit in NEIGHBORS[move]:
+                    if free & bit:
+                        yield moved | CELLS[build] << 6
+                # Building on the space just left is always allowed
+                yield moved | start_cell
+
+    def count_turns(self, pid):
+        """Number of legal turns of pid, without listing them"""
+        free = self.build_mask()
+        count = 0
+        for worker in self.get_workers(pid):
+            for move in self.iter_moves(worker.cord):
+                count += (free & NEIGHBOR_MASKS[move]).bit_count() + 1
+        return count
+
+    def has_turn(self, pid):
+        """Whether pid has any legal turn"""
+        for worker in self.get_workers(pid):
+            if self.move_mask(worker.cord) & NEIGHBOR_MASKS[worker.cord]:
+                return True
+        return False
+
+    def snapshot(self):
+        """
+        Packs the full board state into one int: the four level masks
+        (25 bits each) followed by each worker's cell (5 bits, 31 if unplaced)
+        """
+        state = 0
+        for level, mask in enumerate(self._levels):
+            state |= mask << (25 * level)
+        for slot, worker in enumerate(self._workers):
+            state |= CELLS.get(worker.cord, 31) << (100 + 5 * slot)
+        return state
+
+    def restore(self, state):
+        """Resets the board to a state returned by snapshot()"""
+        self._levels = [(state >> (25 * level)) & 0x1ffffff for level in range(4)]
+        self._zobrist = 0
+        for cord, bit in BITS.items():
+            for level in range(self._height(bit)):
+                self._zobrist ^= ZOBRIST_BLOCKS[cord][level]
+
+        self._worker_masks = [0] * len(self._workers)
+        self._occupied = 0
+        self._heights = [0, 0, 0]
+        self._centers = [0, 0, 0]
+        self._distances = [0, 0, 0]
+        for worker in self._workers:
+            worker.move(None)
+        for slot, worker in enumerate(self._workers):
+            cell = (state >> (100 + 5 * slot)) & 31
+            if cell != 31:
+                self.move(worker, CORDS[cell])
+
+    def pack_memento(self, turn_memento):
+        """Packs a TurnMemento into worker slot | move << 2 | build << 7 | was << 12"""
+        worker, move_space, build_space, was_space = turn_memento.get_turn()
+        return (self._slots[worker] | CELLS[move_space] << 2 | CELLS[build_space] << 7
+                | CELLS[was_space] << 12)
+
+    def unpack_memento(self, packed):
+        return TurnMemento((self._workers[packed & 3], CORDS[(packed >> 2) & 31],
+                            CORDS[(packed >> 7) & 31], CORDS[packed >> 12]))
 
     def save(self, turn_memento):
         self._caretaker.save(turn_memento)
@@ -106,6 +391,14 @@ class Board:
     def redo(self):
         return self._caretaker.redo()
 
+    def jump(self, turn):
+        """Moves the board to the position after `turn` saved turns"""
+        return self._caretaker.jump(turn)
+
+    @property
+    def history(self):
+        return self._caretaker
+
     def redo_turn(self, turn_memento):
         worker, move_space, build_space, was_space = turn_memento.get_turn()
         self.move(worker, move_space)
@@ -144,14 +437,13 @@ class Space:
         (4, 4): 0
     }
 
-    def __init__(self, cord, observer):
+    def __init__(self, cord):
         # Tuple (x,y)
         self._cord = cord
         # Reference to the Worker
         self._worker = None
         # Int 0-4
         self._level = 0
-        self._observer = observer
         self._rank = Space.pos_rank.get(cord)
 
     def __str__(self):
@@ -165,10 +457,6 @@ class Space:
 
     def add_worker(self, worker):
         self._worker = worker
-        self._notify()
-
-    def _notify(self):
-        self._observer(self._level)
 
     def is_unoccupied(self):
         if self._worker or self._level == 4:
@@ -237,21 +525,6 @@ class Worker:
         return self._id
 
 
-class VictoryObserver():
-
-    def __init__(self):
-        self._running = True
-
-    @property
-    def running(self):
-        return self._running
-
-    def __call__(self, level):
-        if level == 3:
-            # print("at level 3")
-            self._running = False
-
-
 class BoardAdjacencyIter:
     """Returns an iterable of a space's valid adjacent spaces"""
     
@@ -259,36 +532,10 @@ class BoardAdjacencyIter:
         """type = True will check height differences for workers movement.
         type = False will only check if the spaces are unoccupied"""
 
-        adj_cords = []
-
-        # Loop through 8 possible moves
-        for x in range(-1,2):
-            for y in range(-1,2):
-                
-                # Don't include the original space itself
-                if x == 0 and y == 0:
-                    continue
-
-                # Check if within bounds of the board
-                if cord[0]+y > 4 or cord[0]+y < 0:
-                    continue
-                if cord[1]+x > 4 or cord[1]+x < 0:
-                    continue
-
-                # Determining whether a worker can move to candidate from original
-                candidate = tuple(map(sum, zip(cord, (y,x))))
-                if type:
-                    if not board.check_heights(cord, candidate):
-                        continue
-                if not board.is_unoccupied(candidate):
-                    continue
-
-                adj_cords.append(candidate)
-
-        self._spaces = []
+        free = board.move_mask(cord) if type else board.build_mask()
+
+        self._spaces = [candidate for candidate, bit in NEIGHBORS[cord] if free & bit]
         self._index = 0
-        for y,x in adj_cords:
-            self._spaces.append((y,x))
 
     def __next__(self):
         if self._index == len(self._spaces):
@@ -315,39 +562,95 @@ class TurnMemento:
 class Caretaker:
     """
     Manages the TurnMementos
+
+    Turns are stored packed (Board.pack_memento) in a ring buffer of
+    `history` entries, allocated on the first save() so boards that never
+    record turns (headless games, searches) do not pay for it; once it is
+    full the oldest turns are forgotten. Every `checkpoint_interval` turns a full Board.snapshot is
+    kept, so jump() replays at most about one interval of turns.
     """
-    def __init__(self, board:Board):
-        self._future = []   # redo
-        self._history = []  # undo
+    def __init__(self, board:Board, history = 4096, checkpoint_interval = 32):
         self._board = board
+        self._history = history
+        self._buffer = None
+        self._interval = checkpoint_interval
+        self._checkpoints = {}
+        self._first = 0     # oldest turn that can be undone to
+        self._turn = 0      # turns currently applied
+        self._last = 0      # newest turn that can be redone to
+
+    @property
+    def turn(self):
+        return self._turn
+
+    @property
+    def first_turn(self):
+        return self._first
+
+    @property
+    def last_turn(self):
+        return self._last
 
     def save(self, turn_memento):
         """
         Saves a turn log containing:
         (worker, move_space, build_space, was_space)
         """
+        if self._buffer is None:
+            self._buffer = array('I', [0]) * self._history
+        size = len(self._buffer)
+
+        # Empty out redo turns whenever player takes turn
+        for turn in [turn for turn in self._checkpoints if turn > self._turn]:
+            del self._checkpoints[turn]
+
+        # Forget the oldest turn when the buffer is full
+        if self._turn - self._first == size:
+            self._first += 1
+            self._checkpoints.pop(self._first - 1, None)
+
+        self._buffer[self._turn % size] = self._board.pack_memento(turn_memento)
+        self._turn += 1
+        self._last = self._turn
+
+        if self._turn % self._interval == 0:
+            self._checkpoints[self._turn] = self._board.snapshot()
+
+    def _memento(self, turn):
+        """Memento of the turn that moved from position `turn` to `turn` + 1"""
+        return self._board.unpack_memento(self._buffer[turn % len(self._buffer)])
 
-        # Empty out redo list whenever player takes turn
-        self._future = []
-        self._history.append(turn_memento)
-        
     def undo(self):
 
-        # check if there are past moves (WIP DO WE NEED TO DO SOMETHING WHEN UNDO NOT POSSIBLE?)
-        if len(self._history) == 0:
+        if self._turn == self._first:
             return False
-        memento = self._history.pop()
-        # Add to future list for redos
-        self._future.append(memento)
-        self._board.undo_turn(memento)
+        self._turn -= 1
+        self._board.undo_turn(self._memento(self._turn))
         return True
 
     def redo(self):
 
-        if len(self._future) == 0:
+        if self._turn == self._last:
             return False
-        memento = self._future.pop()
-        # Re-add to history list for re-undos
-        self._history.append(memento)
-        self._board.redo_turn(memento)
-        return True
\ No newline at end of file
+        self._board.redo_turn(self._memento(self._turn))
+        self._turn += 1
+        return True
+
+    def jump(self, turn):
+        """
+        Moves to the position after `turn` turns, restoring the nearest
+        checkpoint when that is closer than stepping from the current turn
+        """
+        if turn < self._first or turn > self._last:
+            return False
+
+        start = min([self._turn] + list(self._checkpoints), key=lambda c: abs(c - turn))
+        if start != self._turn:
+            self._board.restore(self._checkpoints[start])
+            self._turn = start
+
+        while self._turn > turn:
+            self.undo()
+        while self._turn < turn:
+            self.redo()
+        return True
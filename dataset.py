@@ -0,0 +1,135 @@
+import argparse
+import multiprocessing
+import os
+
+import numpy as np
+
+from board import CELLS, CORDS
+from gamerecord import GameRecord
+from selfplay import HeadlessGame, OPENING_TURNS_HELP
+from tournament import PlayerSpec
+
+# Every position before a turn becomes one row of each array in a shard:
+#   heights  uint8 (N, 25)  block height of every cell, cell = row * 5 + col
+#   cells    uint8 (N, 4)   cells of workers A, B, Y, Z
+#   side     uint8 (N,)     pid to move
+#   result   int8  (N,)     1 if the side to move went on to win, else -1
+#   game     uint32 (N,)    seed of the game the position came from
+FIELDS = {"heights": (np.uint8, (25,)), "cells": (np.uint8, (4,)), "side": (np.uint8, ()),
+          "result": (np.int8, ()), "game": (np.uint32, ())}
+
+
+def _encode_game(task):
+    """Plays one game and returns its positions as a dict of arrays"""
+    p1, p2, seed, opening_turns = task
+    game = HeadlessGame(p1.player_type, p2.player_type, seed, p1.options, p2.options, opening_turns)
+    winner, count = game.run()
+
+    heights = np.zeros((count, 25), np.uint8)
+    cells = np.zeros((count, 4), np.uint8)
+    side = np.zeros(count, np.uint8)
+    record = GameRecord(p1.player_type, p2.player_type, winner, game.turns)
+    for i, (board, pid, turn) in enumerate(record.replay()):
+        heights[i] = [board.get_height(cord) for cord in CORDS]
+        cells[i] = [CELLS[worker.cord] for player in (1, 2) for worker in board.get_workers(player)]
+        side[i] = pid
+    result = np.where(side == winner, 1, -1).astype(np.int8)
+    return {"heights": heights, "cells": cells, "side": side, "result": result,
+            "game": np.full(count, seed, np.uint32)}
+
+
+class ShardWriter:
+    """
+    Buffers positions in preallocated arrays of shard_size rows and writes
+    each full buffer as a compressed .npz shard, so memory stays the same
+    however many positions pass through. close() writes the last, partial shard.
+    """
+
+    def __init__(self, directory, shard_size = 100000, prefix = "positions"):
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._prefix = prefix
+        self._shard_size = shard_size
+        self._buffers = {name: np.zeros((shard_size,) + shape, dtype)
+                         for name, (dtype, shape) in FIELDS.items()}
+        self._filled = 0
+        self.shards = 0
+        self.positions = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, arrays):
+        """Appends the rows of a dict of FIELDS arrays, flushing shards as they fill"""
+        count = len(arrays["side"])
+        done = 0
+        while done < count:
+            take = min(count - done, self._shard_size - self._filled)
+            for name, buffer in self._buffers.items():
+                buffer[self._filled:self._filled + take] = arrays[name][done:done + take]
+            self._filled += take
+            done += take
+            if self._filled == self._shard_size:
+                self._flush()
+        self.positions += count
+
+    def _flush(self):
+        if not self._filled:
+            return
+        path = os.path.join(self._directory, f"{self._prefix}-{self.shards:05d}.npz")
+        np.savez_compressed(path, **{name: buffer[:self._filled]
+                                     for name, buffer in self._buffers.items()})
+        self.shards += 1
+        self._filled = 0
+
+    def close(self):
+        self._flush()
+
+
+def generate(directory, p1, p2, games, shard_size = 100000, processes = None, seed = 0,
+             prefix = "positions", opening_turns = 4):
+    """
+    Plays games between two PlayerSpecs across a process pool (game i uses
+    seed + i and opens with opening_turns random turns, see HeadlessGame)
+    and streams their positions into shards. Returns the ShardWriter.
+    """
+    with ShardWriter(directory, shard_size, prefix) as writer:
+        if processes == 1:
+            for i in range(games):
+                writer.add(_encode_game((p1, p2, seed + i, opening_turns)))
+            return writer
+
+        with multiprocessing.Pool(processes) as pool:
+            # Pool queues every task it is given up front, so hand it a
+            # bounded batch at a time to keep pending games and results bounded
+            batch = 64 * (processes or os.cpu_count() or 1)
+            for first in range(0, games, batch):
+                tasks = [(p1, p2, seed + i, opening_turns) for i in range(first, min(games, first + batch))]
+                for arrays in pool.imap(_encode_game, tasks, 4):
+                    writer.add(arrays)
+    return writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate training positions from bot-vs-bot games")
+    parser.add_argument("directory", help="where to write the .npz shards")
+    parser.add_argument("p1", type=PlayerSpec.parse, help="white player, e.g. heuristic or alphabeta:depth=2")
+    parser.add_argument("p2", type=PlayerSpec.parse, help="blue player")
+    parser.add_argument("games", type=int)
+    parser.add_argument("--shard-size", type=int, default=100000, help="positions per shard")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prefix", default="positions", help="shard file name prefix")
+    parser.add_argument("--opening-turns", type=int, default=4, help=OPENING_TURNS_HELP)
+    args = parser.parse_args()
+
+    writer = generate(args.directory, args.p1, args.p2, args.games, args.shard_size,
+                      args.processes, args.seed, args.prefix, args.opening_turns)
+    print(f"wrote {writer.positions} positions in {writer.shards} shards to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import mmap
+import struct
+import sys
+from array import array
+
+from board import decode_turn
+from players import start_board
+
+# File layout (little-endian):
+#   file header: magic, format version
+#   per game:    p1 type, p2 type, winning pid (0 if unfinished), turn count,
+#                then one uint16 board.encode_turn value per turn.
+# Player 1 makes the even-numbered turns, player 2 the odd ones.
+MAGIC = b"SNTR"
+VERSION = 1
+FILE_HEADER = struct.Struct("<4sB3x")
+GAME_HEADER = struct.Struct("<BBbxI")
+
+
+class GameRecordWriter:
+    """
+    Appends games to a record file one at a time. Turns of the game in
+    progress are buffered (2 bytes each) and the game is written when
+    end_game is called. append_turn can be registered as a board turn hook.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._players = None
+        self._turns = array('H')
+        self.games = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def begin_game(self, p1_type, p2_type):
+        self._players = (p1_type, p2_type)
+        self._turns = array('H')
+
+    def append_turn(self, turn):
+        self._turns.append(turn)
+
+    def truncate(self, turns):
+        """Drops the buffered turns after the first `turns`, e.g. ones since undone"""
+        del self._turns[turns:]
+
+    def end_game(self, winner = 0):
+        if self._players is None:
+            raise ValueError("end_game called without begin_game")
+        self.write_game(self._players[0], self._players[1], winner, self._turns)
+        self._players = None
+
+    def write_game(self, p1_type, p2_type, winner, turns):
+        """Writes a whole game at once from any sequence of encoded turns"""
+        if not isinstance(turns, array):
+            turns = array('H', turns)
+        self._file.write(GAME_HEADER.pack(p1_type, p2_type, winner, len(turns)))
+        if sys.byteorder == "big":
+            turns = array('H', turns)
+            turns.byteswap()
+        self._file.write(turns.tobytes())
+        self.games += 1
+
+    def close(self):
+        self._file.close()
+
+
+class GameRecord:
+    """One game from a record file"""
+
+    def __init__(self, p1_type, p2_type, winner, turns):
+        self.p1_type = p1_type
+        self.p2_type = p2_type
+        self.winner = winner
+        self.turns = turns
+
+    def __len__(self):
+        return len(self.turns)
+
+    def replay(self):
+        """
+        Yields (board, pid, turn) before each turn is played on a fresh board.
+        The same board is reused, so copy what is needed before the next step.
+        """
+        board = start_board()
+        for i, turn in enumerate(self.turns):
+            pid = 1 if i % 2 == 0 else 2
+            yield board, pid, turn
+            index, move_space, build_space = decode_turn(turn)
+            board.move(board.get_workers(pid)[index], move_space)
+            board.build(build_space)
+
+
+class GameRecordReader:
+    """
+    Memory-maps a record file and returns its games lazily; game offsets
+    are found by hopping from header to header as games are requested.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} game record")
+        self._offsets = [FILE_HEADER.size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self, offset):
+        """Returns the game at offset and the offset of the next game"""
+        p1_type, p2_type, winner, count = GAME_HEADER.unpack_from(self._map, offset)
+        start = offset + GAME_HEADER.size
+        end = start + 2 * count
+        turns = array('H', self._map[start:end])
+        if sys.byteorder == "big":
+            turns.byteswap()
+        return GameRecord(p1_type, p2_type, winner, turns), end
+
+    def __iter__(self):
+        offset = FILE_HEADER.size
+        while offset < len(self._map):
+            game, offset = self._read(offset)
+            yield game
+
+    def _find_offsets(self, index = None):
+        """Hops through game headers until index is known, or to the end if index is None"""
+        while index is None or len(self._offsets) <= index:
+            offset = self._offsets[-1]
+            if offset >= len(self._map):
+                break
+            count = GAME_HEADER.unpack_from(self._map, offset)[3]
+            self._offsets.append(offset + GAME_HEADER.size + 2 * count)
+
+    def __len__(self):
+        self._find_offsets()
+        # The last offset found is the end of the file
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            # Counting from the end needs every offset
+            index += len(self)
+            if index < 0:
+                raise IndexError("game index out of range")
+        self._find_offsets(index)
+        if index >= len(self._offsets) or self._offsets[index] >= len(self._map):
+            raise IndexError("game index out of range")
+        return self._read(self._offsets[index])[0]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
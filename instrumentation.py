@@ -0,0 +1,292 @@
+import cProfile
+import csv
+import json
+import time
+from types import SimpleNamespace
+
+import mcts
+import search
+
+# Columns of every per-turn record
+FIELDS = ("game", "turn", "pid", "triples", "scored", "input_ms", "board_ms", "display_ms")
+
+
+class Sink:
+    """Receives per-turn records; subclasses override what they need"""
+
+    def begin_game(self, game):
+        pass
+
+    def record(self, row):
+        pass
+
+    def end_game(self, game):
+        pass
+
+    def close(self):
+        pass
+
+
+class MemorySink(Sink):
+    """Keeps every record in a list"""
+
+    def __init__(self):
+        self.rows = []
+
+    def record(self, row):
+        self.rows.append(row)
+
+    def summary(self):
+        """Totals of each counter and timer over all records"""
+        totals = {field: 0 for field in FIELDS[3:]}
+        for row in self.rows:
+            for field in totals:
+                totals[field] += row[field]
+        return totals
+
+
+class CSVSink(Sink):
+    def __init__(self, path):
+        self._file = open(path, "w", newline="")
+        self._writer = csv.DictWriter(self._file, FIELDS)
+        self._writer.writeheader()
+
+    def record(self, row):
+        self._writer.writerow(row)
+
+    def close(self):
+        self._file.close()
+
+
+class JSONLinesSink(Sink):
+    def __init__(self, path):
+        self._file = open(path, "w")
+
+    def record(self, row):
+        self._file.write(json.dumps(row) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+class ProfileSink(Sink):
+    """
+    Runs cProfile for each game and dumps its stats to path, which may
+    contain {game} to keep one file per game
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._profile = None
+
+    def begin_game(self, game):
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def end_game(self, game):
+        self._profile.disable()
+        self._profile.dump_stats(self._path.format(game=game))
+        self._profile = None
+
+
+def sink_from_spec(spec):
+    """'memory', or a path ending in .csv, .jsonl or .prof"""
+    if spec == "memory":
+        return MemorySink()
+    if spec.endswith(".csv"):
+        return CSVSink(spec)
+    if spec.endswith(".jsonl"):
+        return JSONLinesSink(spec)
+    if spec.endswith(".prof"):
+        return ProfileSink(spec)
+    raise ValueError(f"unknown instrumentation sink {spec!r}")
+
+
+class Instrumentation:
+    """
+    Per-turn counters and timers for a game. attach() wraps methods on the
+    player, board and CLI instances it is given, and the turn generation
+    and evaluation functions of the search modules until detach(), so
+    nothing is measured (and nothing costs anything) unless a game is attached.
+
+    triples counts turns where they are generated: Board.iter_turns,
+    Board.count_turns and search.list_turns. A position whose turns are
+    both counted and listed in one turn (as RandomPlayer does) counts
+    them once. scored counts calc_score, calc_move_score and evaluate
+    calls, and every turn scored by batch_eval.
+    """
+
+    def __init__(self, sink:Sink):
+        self._sink = sink
+        self._game = 0
+        self._turn = 0
+        self._pid = 0
+        self._in_input = False
+        self._patched = []
+        self._reset()
+
+    @property
+    def sink(self):
+        return self._sink
+
+    def _reset(self):
+        # (zobrist, pid) -> turns already counted for that position this turn
+        self._generated = {}
+        self._triples = 0
+        self._scored = 0
+        self._input_time = 0.0
+        self._board_time = 0.0
+        self._display_time = 0.0
+
+    def attach(self, board, players, cli = None):
+        """Instruments a board and its players, and the CLI displaying them if given"""
+        for player in players:
+            self._wrap_player(player)
+        for name in ("move", "build"):
+            self._wrap_board(board, name)
+        self._wrap_turn_generation(board)
+        self._patch_search()
+        if cli is not None:
+            self._wrap_display(cli)
+        board.add_turn_hook(self._end_turn)
+
+        self._game += 1
+        self._turn = 0
+        self._reset()
+        self._sink.begin_game(self._game)
+
+    def detach(self):
+        """Ends the attached game; the wrapped instances keep their wrappers"""
+        for module, name, original in reversed(self._patched):
+            setattr(module, name, original)
+        self._patched = []
+        self._sink.end_game(self._game)
+
+    def close(self):
+        self._sink.close()
+
+    def _wrap_player(self, player):
+        input_turn = player._input_turn
+
+        def timed_input_turn():
+            self._pid = player._pid
+            self._in_input = True
+            start = time.perf_counter()
+            try:
+                return input_turn()
+            finally:
+                self._input_time += time.perf_counter() - start
+                self._in_input = False
+
+        player._input_turn = timed_input_turn
+
+        for name in ("calc_score", "calc_move_score"):
+            self._count_calls(player, name)
+
+        batch_eval = getattr(player, "_batch_eval", None)
+        if batch_eval is not None:
+            def counted_best_turn(board, pid, turns, *args):
+                self._scored += len(turns)
+                return batch_eval.best_turn(board, pid, turns, *args)
+            player._batch_eval = SimpleNamespace(best_turn=counted_best_turn)
+
+    def _count_calls(self, player, name):
+        method = getattr(player, name)
+
+        def counted(*args):
+            self._scored += 1
+            return method(*args)
+        setattr(player, name, counted)
+
+    def _count_generated(self, board, pid, count):
+        """Adds the turns of pid's position beyond those already counted for it this turn"""
+        key = (board.zobrist, pid)
+        counted = self._generated.get(key, 0)
+        if count > counted:
+            self._triples += count - counted
+            self._generated[key] = count
+
+    def _wrap_turn_generation(self, board):
+        iter_turns = board.iter_turns
+        count_turns = board.count_turns
+
+        def counted_iter_turns(pid):
+            key = (board.zobrist, pid)
+            generated = 0
+            for turn in iter_turns(pid):
+                generated += 1
+                if generated > self._generated.get(key, 0):
+                    self._triples += 1
+                    self._generated[key] = generated
+                yield turn
+
+        def counted_count_turns(pid):
+            count = count_turns(pid)
+            self._count_generated(board, pid, count)
+            return count
+
+        board.iter_turns = counted_iter_turns
+        board.count_turns = counted_count_turns
+
+    def _patch(self, module, name, wrapper):
+        self._patched.append((module, name, getattr(module, name)))
+        setattr(module, name, wrapper)
+
+    def _patch_search(self):
+        """Counts the turns listed and positions evaluated by the search players"""
+        list_turns = search.list_turns
+        evaluate = search.evaluate
+
+        def counted_list_turns(board, pid):
+            turns = list_turns(board, pid)
+            if turns is not None:
+                self._triples += len(turns)
+            return turns
+
+        def counted_evaluate(*args):
+            self._scored += 1
+            return evaluate(*args)
+
+        # mcts imported list_turns by name, so it is patched there too
+        for module in (search, mcts):
+            self._patch(module, "list_turns", counted_list_turns)
+        self._patch(search, "evaluate", counted_evaluate)
+
+    def _wrap_board(self, board, name):
+        method = getattr(board, name)
+
+        def timed(*args):
+            # Moves a search makes inside _input_turn are part of its time
+            if self._in_input:
+                return method(*args)
+            start = time.perf_counter()
+            try:
+                return method(*args)
+            finally:
+                self._board_time += time.perf_counter() - start
+        setattr(board, name, timed)
+
+    def _wrap_display(self, cli):
+        display_menu = cli._display_menu
+
+        def timed_display_menu():
+            start = time.perf_counter()
+            try:
+                return display_menu()
+            finally:
+                self._display_time += time.perf_counter() - start
+        cli._display_menu = timed_display_menu
+
+    def _end_turn(self, turn):
+        self._turn += 1
+        self._sink.record({
+            "game": self._game,
+            "turn": self._turn,
+            "pid": self._pid,
+            "triples": self._triples,
+            "scored": self._scored,
+            "input_ms": self._input_time * 1000,
+            "board_ms": self._board_time * 1000,
+            "display_ms": self._display_time * 1000,
+        })
+        self._reset()
@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import random
+import time
+
+from board import Board, Worker
+from server import PIDS
+from players import format_turn
+
+
+class LoadResults:
+    def __init__(self):
+        self.latencies = []
+        self.games = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def __str__(self):
+        turns = len(self.latencies)
+        return (f"{self.games} games, {turns} turns in {self.elapsed:.1f} s "
+                f"({turns / self.elapsed if self.elapsed else 0:.0f} turns/sec), {self.errors} errors; "
+                f"round trip p50 {self.percentile(0.5) * 1000:.1f} ms, "
+                f"p95 {self.percentile(0.95) * 1000:.1f} ms, p99 {self.percentile(0.99) * 1000:.1f} ms")
+
+
+async def _client(open_connection, opponent, games, results, rng):
+    """Plays games as a random mover, timing each MOVE until the next TURN or WINNER"""
+    reader, writer = await open_connection()
+    board = Board([Worker('A'), Worker('B'), Worker('Y'), Worker('Z')])
+    pid = 1
+    sent = None
+    try:
+        await reader.readline()
+        for game in range(games):
+            color = rng.choice(("white", "blue"))
+            writer.write(f"NEW {opponent} {color}\n".encode())
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    return
+                reply, _, argument = line.partition(" ")
+                if reply in ("TURN", "WINNER") and sent is not None:
+                    results.latencies.append(time.perf_counter() - sent)
+                    sent = None
+
+                if reply == "GAME":
+                    pid = PIDS[argument.split()[1]]
+                elif reply == "BOARD":
+                    board.restore(int(argument, 16))
+                elif reply == "TURN":
+                    turns = list(board.iter_turns(pid))
+                    turn = format_turn(board, pid, turns[rng.randrange(len(turns))])
+                    sent = time.perf_counter()
+                    writer.write(f"MOVE {turn}\n".encode())
+                elif reply == "ERROR":
+                    results.errors += 1
+                elif reply == "WINNER":
+                    results.games += 1
+                    break
+        writer.write(b"QUIT\n")
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def run_load(clients, games, opponent = "random", host = "127.0.0.1", port = 7714,
+                   unix = None, seed = 0):
+    """Runs `clients` concurrent connections playing `games` games each and returns LoadResults"""
+    if unix:
+        def open_connection():
+            return asyncio.open_unix_connection(unix)
+    else:
+        def open_connection():
+            return asyncio.open_connection(host, port)
+
+    results = LoadResults()
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(open_connection, opponent, games, results, random.Random(seed + i))
+                           for i in range(clients)))
+    results.elapsed = time.perf_counter() - start
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure turn round trips against a running server.py")
+    parser.add_argument("--clients", type=int, default=200, help="concurrent games")
+    parser.add_argument("--games", type=int, default=5, help="games per client")
+    parser.add_argument("--opponent", default="random", help="bot type the server plays")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7714)
+    parser.add_argument("--unix", help="connect to this Unix socket instead of TCP")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(asyncio.run(run_load(args.clients, args.games, args.opponent, args.host, args.port,
+                               args.unix, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 import sys
 
 from board import Board, Worker
-from players import PlayerFactory, NoValidMoves
+from players import PlayerFactory, NoValidMoves, PLAYER_TYPES, TIMED_TYPES, load_weights
+from openingbook import OpeningBook
+from gamerecord import GameRecordWriter
+from instrumentation import Instrumentation, MemorySink, sink_from_spec
 
 HUMAN = 1
 RANDOM = 2
@@ -9,22 +12,10 @@ HEURISTIC = 3
 
 class BoardCLI:
 
-    def __init__(self, p1_type = HUMAN, p2_type = HUMAN, undo_redo = False, display_score = False):
-        self._p1_type = p1_type
-        if p1_type == 'human':
-            self._p1_type = HUMAN
-        elif p1_type == 'random':
-            self._p1_type = RANDOM
-        elif p1_type == 'heuristic':
-            self._p1_type = HEURISTIC
-
-        self._p2_type = p2_type
-        if p2_type == 'human':
-            self._p2_type = HUMAN
-        elif p2_type == 'random':
-            self._p2_type = RANDOM
-        elif p2_type == 'heuristic':
-            self._p2_type = HEURISTIC
+    def __init__(self, p1_type = HUMAN, p2_type = HUMAN, undo_redo = False, display_score = False, deadline = None,
+                 book = None, instrument = None, weights = None, ponder = False, record = None):
+        self._p1_type = PLAYER_TYPES.get(p1_type, p1_type)
+        self._p2_type = PLAYER_TYPES.get(p2_type, p2_type)
 
         self._undo_redo = False
         if undo_redo == 'on':
@@ -34,14 +25,58 @@ class BoardCLI:
         if display_score == 'on':
             self._display_score = True
 
+        # Per-move time limit in milliseconds for search players
+        self._deadline = None
+        if deadline is not None:
+            self._deadline = float(deadline)
+
+        # Opening book file shared by the computer players
+        self._book = None
+        if book is not None:
+            self._book = OpeningBook(book)
+
+        # Evaluation weights saved by tune.py, used by the computer players
+        self._weights = None
+        if weights is not None:
+            self._weights = load_weights(weights)
+
+        # Search players think on a human opponent's time
+        self._ponder = ponder
+
         self._workers = [Worker('A'), Worker('B'), Worker('Y'), Worker('Z')]
         self._board = Board(self._workers)
 
-        self._players = [PlayerFactory().create_player(self._board, 1, self._workers[0], self._workers[1], self._p1_type),
-                        PlayerFactory().create_player(self._board, 2, self._workers[2], self._workers[3], self._p2_type)]
+        self._players = [PlayerFactory().create_player(self._board, 1, self._workers[0], self._workers[1], self._p1_type,
+                                                       **self._player_options(self._p1_type, self._p2_type)),
+                        PlayerFactory().create_player(self._board, 2, self._workers[2], self._workers[3], self._p2_type,
+                                                       **self._player_options(self._p2_type, self._p1_type))]
 
         self._turn = 0
 
+        # Opt-in per-turn counters and timers ('memory' or a .csv/.jsonl/.prof path)
+        self._instrumentation = None
+        if instrument is not None:
+            self._instrumentation = Instrumentation(sink_from_spec(instrument))
+            self._instrumentation.attach(self._board, self._players, self)
+
+        # Game record file the finished game is appended to
+        self._record = None
+        if record is not None:
+            self._record = GameRecordWriter(record)
+
+    def _player_options(self, player_type, opponent_type):
+        options = {}
+        if self._deadline is not None and player_type in TIMED_TYPES:
+            options["time_ms"] = self._deadline
+        if self._book is not None and player_type != PLAYER_TYPES["human"]:
+            options["book"] = self._book
+        if self._weights is not None and player_type != PLAYER_TYPES["human"]:
+            options.update(self._weights)
+        # Pondering beside a computer opponent would only slow it down
+        if self._ponder and player_type == PLAYER_TYPES["alphabeta"] and opponent_type == PLAYER_TYPES["human"]:
+            options["ponder"] = True
+        return options
+
     def _display_menu(self):
         msg = str(self._board)
         col = "white"
@@ -63,11 +98,21 @@ class BoardCLI:
 
         print(msg)
 
+    def _record_turn(self, turn):
+        # Turns undone before this one was taken are no longer part of the game
+        if self._undo_redo:
+            self._record.truncate(self._board.history.turn - 1)
+        self._record.append_turn(turn)
+
     def run(self):
         has_gridlock = False
 
+        if self._record is not None:
+            self._record.begin_game(self._p1_type, self._p2_type)
+            self._board.add_turn_hook(self._record_turn)
+
         try:
-            # Observer checks if any player is standing on a 4 tall piece
+            # Board.running turns False once a worker stands on level 3
             while self._board.running:
                 self._turn += 1
                 self._display_menu()
@@ -82,6 +127,12 @@ class BoardCLI:
                         if self._board.redo():
                             self._turn += 1
                         self._display_menu()
+                    elif choice.startswith("jump "):
+                        # Jump straight to a displayed turn number
+                        target = choice[5:].strip()
+                        if target.isdigit() and self._board.jump(int(target) - 1):
+                            self._turn = self._board.history.turn + 1
+                        self._display_menu()
                     elif choice == "next":
                         break
 
@@ -91,6 +142,9 @@ class BoardCLI:
         except NoValidMoves:
             # Termination but other player is the winner, not you
             has_gridlock = True
+        finally:
+            for player in self._players:
+                player.close()
 
         # Someone has won!
         self._turn += 1
@@ -104,5 +158,41 @@ class BoardCLI:
         else:
             print("blue has won")
 
+        if self._record is not None:
+            self._board.remove_turn_hook(self._record_turn)
+            self._record.end_game(1 if self._turn % 2 == 0 else 2)
+            self._record.close()
+
+        if self._instrumentation is not None:
+            self._report_instrumentation()
+
+    def _report_instrumentation(self):
+        self._instrumentation.detach()
+        self._instrumentation.close()
+        sink = self._instrumentation.sink
+        if isinstance(sink, MemorySink):
+            totals = sink.summary()
+            print(", ".join(f"{field}: {value:.1f}" for field, value in totals.items()))
+
 if __name__ == "__main__":
-    BoardCLI(*sys.argv[1:]).run()
\ No newline at end of file
+    # Players, undo/redo and score display are positional; the rest are
+    # --deadline=MS, --book=FILE, --instrument=SINK, --weights=FILE, --record=FILE and --ponder,
+    # in any position
+    flags = {"--deadline=": "deadline", "--book=": "book", "--instrument=": "instrument", "--weights=": "weights",
+             "--record=": "record"}
+    args = []
+    options = {}
+    for arg in sys.argv[1:]:
+        if arg == "--ponder":
+            options["ponder"] = True
+            continue
+        for flag, name in flags.items():
+            if arg.startswith(flag):
+                options[name] = arg[len(flag):]
+                break
+        else:
+            args.append(arg)
+    if len(args) > 4:
+        sys.exit("usage: main.py [white] [blue] [undo/redo on|off] [score on|off] [--deadline=MS] "
+                 "[--book=FILE] [--instrument=SINK] [--weights=FILE] [--record=FILE] [--ponder]")
+    BoardCLI(*args, **options).run()
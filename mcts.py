@@ -0,0 +1,211 @@
+import math
+import random
+import time
+from array import array
+
+from board import Board, encode_turn, decode_turn
+from search import list_turns, winning_turn
+
+# Node is not expanded yet / has been expanded
+UNEXPANDED = -1
+
+# Terminal state of a node, from the view of the player to move there
+UNKNOWN = 0
+WINS = 1
+LOSES = -1
+
+# Most turns a position can have: 2 workers, 8 moves each, and 8 builds per move
+MAX_TURNS = 128
+
+
+class MonteCarloTreeSearch:
+    """
+    UCT search with uniformly random playouts.
+
+    The tree lives in preallocated parallel arrays indexed by node number
+    (17 bytes per node), and children of a node are stored next to
+    each other. Once max_nodes is reached the tree stops growing and
+    iterations simply play out from the leaf they reach. max_nodes must
+    leave room for the root and all of its children.
+    """
+
+    def __init__(self, board:Board, iterations = None, time_ms = None,
+                 exploration = 1.4, max_nodes = 500000):
+        if max_nodes < MAX_TURNS + 1:
+            raise ValueError(f"max_nodes must be at least {MAX_TURNS + 1} to expand the root")
+        if iterations is None and time_ms is None:
+            iterations = 1000
+        self._board = board
+        self._iterations = iterations
+        self._time_ms = time_ms
+        self._exploration = exploration
+        self._max_nodes = max_nodes
+
+        self._first_child = array('i', bytes(4 * max_nodes))
+        self._child_count = array('H', bytes(2 * max_nodes))
+        self._turns = array('H', bytes(2 * max_nodes))
+        self._visits = array('I', bytes(4 * max_nodes))
+        self._wins = array('I', bytes(4 * max_nodes))
+        self._terminal = array('b', bytes(max_nodes))
+        self._size = 0
+
+        self.iterations = 0
+        self.elapsed = 0.0
+
+    @property
+    def nodes(self):
+        return self._size
+
+    @property
+    def iterations_per_sec(self):
+        if self.elapsed == 0:
+            return 0.0
+        return self.iterations / self.elapsed
+
+    def _add_node(self, turn):
+        node = self._size
+        self._first_child[node] = UNEXPANDED
+        self._child_count[node] = 0
+        self._turns[node] = turn
+        self._visits[node] = 0
+        self._wins[node] = 0
+        self._terminal[node] = UNKNOWN
+        self._size += 1
+        return node
+
+    def _expand(self, node, pid):
+        """Adds a child for every turn of pid, or marks the node terminal"""
+        turns = list_turns(self._board, pid)
+        if turns is None:
+            self._terminal[node] = WINS
+            return
+        if not turns:
+            self._terminal[node] = LOSES
+            return
+        if self._size + len(turns) > self._max_nodes:
+            return
+
+        self._first_child[node] = self._size
+        self._child_count[node] = len(turns)
+        for index, worker, start, move, build in turns:
+            self._add_node(encode_turn(index, move, build))
+
+    def _select(self, node):
+        """Returns the child of node with the highest UCT value"""
+        first = self._first_child[node]
+        log_visits = math.log(max(self._visits[node], 1))
+        visits = self._visits
+        wins = self._wins
+        exploration = self._exploration
+
+        best = first
+        best_value = -1.0
+        for child in range(first, first + self._child_count[node]):
+            child_visits = visits[child]
+            if child_visits == 0:
+                return child
+            value = wins[child] / child_visits + exploration * math.sqrt(log_visits / child_visits)
+            if value > best_value:
+                best = child
+                best_value = value
+        return best
+
+    def _apply(self, pid, turn):
+        """Plays a packed turn of pid and returns what is needed to undo it"""
+        index, move, build = decode_turn(turn)
+        worker = self._board.get_workers(pid)[index]
+        start = worker.cord
+        self._board.move(worker, move)
+        self._board.build(build)
+        return (worker, start, build)
+
+    def _undo(self, played):
+        for worker, start, build in reversed(played):
+            self._board.unbuild(build)
+            self._board.move(worker, start)
+
+    def _playout(self, pid):
+        """Plays random turns from the current position and returns the winner"""
+        board = self._board
+        played = []
+        while True:
+            turns = list_turns(board, pid)
+            if turns is None:
+                winner = pid
+                break
+            if not turns:
+                winner = 3 - pid
+                break
+            index, worker, start, move, build = turns[random.randrange(len(turns))]
+            board.move(worker, move)
+            board.build(build)
+            played.append((worker, start, build))
+            pid = 3 - pid
+        self._undo(played)
+        return winner
+
+    def _iterate(self, pid):
+        node = 0
+        path = [0]
+        played = []
+
+        # Selection: walk down expanded nodes, expanding a leaf on its second visit
+        while self._terminal[node] == UNKNOWN:
+            if self._first_child[node] == UNEXPANDED:
+                if node != 0 and self._visits[node] == 0:
+                    break
+                self._expand(node, pid)
+                if self._first_child[node] == UNEXPANDED:
+                    break
+            node = self._select(node)
+            played.append(self._apply(pid, self._turns[node]))
+            path.append(node)
+            pid = 3 - pid
+
+        # Simulation
+        if self._terminal[node] == WINS:
+            winner = pid
+        elif self._terminal[node] == LOSES:
+            winner = 3 - pid
+        else:
+            winner = self._playout(pid)
+        self._undo(played)
+
+        # Backpropagation: each node is credited to the player who moved into it
+        mover = 3 - pid
+        for node in reversed(path):
+            self._visits[node] += 1
+            if winner == mover:
+                self._wins[node] += 1
+            mover = 3 - mover
+
+    def search(self, pid):
+        """Returns the most visited (worker, move_space, build_space) for pid"""
+        start_time = time.perf_counter()
+        self.iterations = 0
+
+        turn = winning_turn(self._board, pid)
+        if turn is not None:
+            self.elapsed = time.perf_counter() - start_time
+            return turn
+
+        self._size = 0
+        self._add_node(0)
+
+        deadline = None
+        if self._time_ms is not None:
+            deadline = start_time + self._time_ms / 1000
+        while True:
+            if self._iterations is not None and self.iterations >= self._iterations:
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            self._iterate(pid)
+            self.iterations += 1
+
+        first = self._first_child[0]
+        best = max(range(first, first + self._child_count[0]), key=lambda child: self._visits[child])
+        index, move, build = decode_turn(self._turns[best])
+
+        self.elapsed = time.perf_counter() - start_time
+        return (self._board.get_workers(pid)[index], move, build)
@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import mmap
+import struct
+
+from board import Board, encode_turn
+from gamerecord import GameRecordReader
+from players import start_board
+from search import AlphaBetaSearch, evaluate, list_turns, position_key
+from symmetry import canonical, to_canonical, from_canonical
+from transposition import TranspositionTable
+
+# File layout (little-endian):
+#   header:  magic, format version, flags, entry count
+#   entries: position key (uint64), board.encode_turn value (uint16),
+#            sorted by key so lookups can binary search the mapped file
+# In a SYMMETRIC book the key is a hash of symmetry.canonical's key and the
+# turn is stored in the canonical frame, so the 8 mirror images of a
+# position (with either worker order) share one entry. Otherwise the key is
+# search.position_key.
+MAGIC = b"SNBK"
+VERSION = 1
+SYMMETRIC = 1
+HEADER = struct.Struct("<4sBB2xI")
+ENTRY = struct.Struct("<QH")
+
+
+def _canonical_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.to_bytes(16, "little"), digest_size=8).digest(), "little")
+
+
+def book_entry(board:Board, pid, turn, symmetric = False):
+    """The key and stored turn for playing turn in this position"""
+    if not symmetric:
+        return position_key(board, pid), turn
+    key, transform, swap = canonical(board, pid)
+    return _canonical_hash(key), to_canonical(turn, pid, transform, swap)
+
+
+def write_book(path, book, symmetric = False):
+    """Writes a {key: turn} dict of book_entry pairs as a sorted index"""
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, SYMMETRIC if symmetric else 0, len(book)))
+        for key in sorted(book):
+            file.write(ENTRY.pack(key, book[key]))
+
+
+class OpeningBook:
+    """
+    A memory-mapped book written by write_book. Lookups binary search
+    the sorted entries, so only O(log n) entries are touched per probe.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, self._count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} opening book")
+        self.symmetric = bool(flags & SYMMETRIC)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def lookup(self, key):
+        """Returns the encoded turn stored for key, or None"""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, turn = ENTRY.unpack_from(self._map, HEADER.size + middle * ENTRY.size)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return turn
+        return None
+
+    def probe(self, board:Board, pid):
+        """Returns the book turn for pid in this position if it is legal here, or None"""
+        if self.symmetric:
+            key, transform, swap = canonical(board, pid)
+            turn = self.lookup(_canonical_hash(key))
+            if turn is not None:
+                turn = from_canonical(turn, pid, transform, swap)
+        else:
+            turn = self.lookup(position_key(board, pid))
+        # A hash collision could name a turn from another position
+        if turn is None or turn not in board.iter_turns(pid):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return turn
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def build_from_search(plies, depth = 2, width = 3, table_bytes = 16 * 1024 * 1024,
+                      symmetric = False):
+    """
+    Searches every position reachable from the start within plies turns,
+    following the searched turn plus the width best turns by static
+    evaluation at each position. Returns a {key: turn} dict of book_entry pairs.
+    """
+    board = start_board()
+    search = AlphaBetaSearch(board, depth, TranspositionTable(table_bytes))
+    book = {}
+
+    def expand(pid, ply):
+        key = book_entry(board, pid, 0, symmetric)[0]
+        if ply >= plies or key in book:
+            return
+        turns = list_turns(board, pid)
+        # Won or lost positions are left to the player
+        if not turns:
+            return
+
+        (worker, move, build), score = search.search(pid)
+        searched = encode_turn(board.get_workers(pid).index(worker), move, build)
+        book[key] = book_entry(board, pid, searched, symmetric)[1]
+
+        ranked = []
+        for turn in turns:
+            index, worker, start, move, build = turn
+            board.move(worker, move)
+            board.build(build)
+            ranked.append((evaluate(board, pid), encode_turn(index, move, build), turn))
+            board.unbuild(build)
+            board.move(worker, start)
+        ranked.sort(key=lambda item: item[0], reverse=True)
+
+        followed = [turn for score, code, turn in ranked if code == searched]
+        followed += [turn for score, code, turn in ranked[:width] if code != searched]
+        for index, worker, start, move, build in followed:
+            board.move(worker, move)
+            board.build(build)
+            expand(3 - pid, ply + 1)
+            board.unbuild(build)
+            board.move(worker, start)
+
+    expand(1, 0)
+    return book
+
+
+def build_from_records(record_path, plies, min_games = 10, symmetric = False):
+    """
+    Picks, for every position seen within the first plies turns of the
+    recorded games, the turn with the best win rate among those played
+    at least min_games times. Returns a {key: turn} dict of book_entry pairs.
+    """
+    # key -> {stored turn: [games, wins]}
+    stats = {}
+    with GameRecordReader(record_path) as reader:
+        for game in reader:
+            for ply, (board, pid, turn) in enumerate(game.replay()):
+                if ply >= plies:
+                    break
+                key, stored = book_entry(board, pid, turn, symmetric)
+                counts = stats.setdefault(key, {}).setdefault(stored, [0, 0])
+                counts[0] += 1
+                if game.winner == pid:
+                    counts[1] += 1
+
+    book = {}
+    for key, turns in stats.items():
+        played = [(wins / games, turn) for turn, (games, wins) in turns.items() if games >= min_games]
+        if played:
+            book[key] = max(played)[1]
+    return book
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a Santorini opening book")
+    parser.add_argument("path", help="book file to write")
+    parser.add_argument("--plies", type=int, default=4, help="turns from the start to cover")
+    parser.add_argument("--depth", type=int, default=2, help="search depth per position")
+    parser.add_argument("--width", type=int, default=3,
+                        help="extra turns per position to follow besides the searched one")
+    parser.add_argument("--records", help="build from a game record file instead of searching")
+    parser.add_argument("--min-games", type=int, default=10,
+                        help="games a turn must appear in to be chosen from records")
+    parser.add_argument("--symmetric", action="store_true",
+                        help="share entries between mirror images of a position")
+    args = parser.parse_args()
+
+    if args.records:
+        book = build_from_records(args.records, args.plies, args.min_games, args.symmetric)
+    else:
+        book = build_from_search(args.plies, args.depth, args.width, symmetric=args.symmetric)
+    write_book(args.path, book, args.symmetric)
+    print(f"wrote {len(book)} positions to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
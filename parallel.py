@@ -0,0 +1,198 @@
+import argparse
+import multiprocessing
+import os
+import random
+import time
+
+from board import Board, Worker, DEFAULT_WEIGHTS, encode_turn, decode_turn
+from players import start_board
+from search import AlphaBetaSearch, WIN, winning_turn
+from transposition import TranspositionTable
+
+# Each pool process keeps its own board and search, set up by _init_process
+_board = None
+_table = None
+_search = None
+# The root search the table holds entries for
+_root_search = None
+
+
+def _init_process(table_bytes, weights):
+    global _board, _table, _search
+    _board = Board([Worker('A'), Worker('B'), Worker('Y'), Worker('Z')])
+    _table = TranspositionTable(table_bytes) if table_bytes else None
+    _search = AlphaBetaSearch(_board, table=_table, weights=weights)
+
+
+def _search_share(task):
+    """Searches one share of the root turns from a Board.snapshot"""
+    global _root_search
+    root_search, state, pid, codes, depth, time_ms = task
+    _board.restore(state)
+    # A table left over from other positions would make results depend on
+    # scheduling; entries from earlier depths of the same root search are kept
+    if _table is not None and root_search != _root_search:
+        _table.clear()
+        _root_search = root_search
+    result = _search.search_turns(pid, codes, depth, time_ms)
+    return result, _search.nodes
+
+
+class ParallelSearch:
+    """
+    Root-parallel alpha-beta search. The ordered root turns are dealt
+    round-robin to a process pool and each process searches its share
+    from a Board.snapshot int, so no Board, Worker or Caretaker objects
+    are pickled. The best score wins, ties going to the turn that comes
+    first in the ordered root, so the result does not depend on which
+    process finishes first. Processes share no alpha bound, so more
+    nodes are searched in total than by AlphaBetaSearch.
+    """
+
+    def __init__(self, board:Board, depth = 2, processes = None,
+                 table_bytes = 16 * 1024 * 1024, weights = DEFAULT_WEIGHTS):
+        self._board = board
+        self._depth = depth
+        self._processes = processes or os.cpu_count() or 1
+        self._pool = multiprocessing.Pool(self._processes, _init_process, (table_bytes, weights))
+        # Orders the root turns in this process
+        self._root = AlphaBetaSearch(board, depth)
+        self._root_searches = 0
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.depth_reached = 0
+
+    @property
+    def nps(self):
+        if self.elapsed == 0:
+            return 0.0
+        return self.nodes / self.elapsed
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+    def _search_depth(self, pid, codes, depth, time_ms = None):
+        """Returns the best (index in codes, score) at depth, or None if time ran out"""
+        state = self._board.snapshot()
+        shares = [codes[i::self._processes] for i in range(self._processes)]
+        tasks = [(self._root_searches, state, pid, share, depth, time_ms) for share in shares if share]
+        best = None
+        for result, nodes in self._pool.map(_search_share, tasks, 1):
+            self.nodes += nodes
+            if result is None:
+                return None
+            code, score = result
+            candidate = (-score, codes.index(code))
+            if best is None or candidate < best:
+                best = candidate
+        return best[1], -best[0]
+
+    def _finish(self, pid, code, score, start_time):
+        self.elapsed = time.perf_counter() - start_time
+        index, move, build = decode_turn(code)
+        return (self._board.get_workers(pid)[index], move, build), score
+
+    def _root_codes(self, pid):
+        turns = self._root._list_turns(pid)
+        if turns is None:
+            return None
+        return [encode_turn(turn[0], turn[3], turn[4]) for turn in turns]
+
+    def search(self, pid):
+        """Returns the best (worker, move_space, build_space) for pid and its score"""
+        self.nodes = 1
+        self._root_searches += 1
+        start_time = time.perf_counter()
+        codes = self._root_codes(pid)
+        if codes is None:
+            self.elapsed = time.perf_counter() - start_time
+            return winning_turn(self._board, pid), WIN + self._depth
+
+        index, score = self._search_depth(pid, codes, self._depth)
+        self.depth_reached = self._depth
+        return self._finish(pid, codes[index], score, start_time)
+
+    def search_iterative(self, pid, time_ms, max_depth = 64):
+        """
+        Deepens one depth at a time across the pool until time_ms has passed;
+        each depth starts with the previous depth's best turn
+        """
+        self.nodes = 1
+        self._root_searches += 1
+        start_time = time.perf_counter()
+        self.depth_reached = 0
+        codes = self._root_codes(pid)
+        if codes is None:
+            self.elapsed = time.perf_counter() - start_time
+            return winning_turn(self._board, pid), WIN
+
+        best, score = codes[0], 0
+        for depth in range(1, max_depth + 1):
+            remaining = time_ms - (time.perf_counter() - start_time) * 1000
+            if remaining <= 0:
+                break
+            result = self._search_depth(pid, codes, depth, remaining)
+            if result is None:
+                break
+            index, score = result
+            best = codes.pop(index)
+            codes.insert(0, best)
+            self.depth_reached = depth
+            if abs(score) >= WIN:
+                break
+        return self._finish(pid, best, score, start_time)
+
+
+def _random_position(seed, turns):
+    """start_board() after `turns` seeded random turns that do not end the game"""
+    board = start_board()
+    rng = random.Random(seed)
+    for turn in range(turns):
+        pid = turn % 2 + 1
+        choices = [decode_turn(code) for code in board.iter_turns(pid)]
+        choices = [choice for choice in choices if board.get_height(choice[1]) < 3]
+        if not choices:
+            break
+        index, move, build = choices[rng.randrange(len(choices))]
+        board.move(board.get_workers(pid)[index], move)
+        board.build(build)
+    return board
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare parallel and single-process search times")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--positions", type=int, default=5, help="seeded positions to search")
+    parser.add_argument("--turns", type=int, default=6, help="random turns played before each search")
+    args = parser.parse_args()
+
+    serial_time = parallel_time = 0.0
+    agree = 0
+    for seed in range(args.positions):
+        board = _random_position(seed, args.turns)
+        pid = args.turns % 2 + 1
+
+        single = AlphaBetaSearch(board, args.depth, TranspositionTable())
+        single_turn, single_score = single.search(pid)
+        serial_time += single.elapsed
+
+        parallel = ParallelSearch(board, args.depth, args.processes)
+        try:
+            parallel_turn, parallel_score = parallel.search(pid)
+        finally:
+            parallel.close()
+        parallel_time += parallel.elapsed
+
+        agree += (single_turn, single_score) == (parallel_turn, parallel_score)
+        print(f"position {seed}: single {single.elapsed * 1000:.0f} ms ({single.nodes} nodes), "
+              f"parallel {parallel.elapsed * 1000:.0f} ms ({parallel.nodes} nodes), "
+              f"scores {single_score} / {parallel_score}")
+
+    print(f"{args.processes or os.cpu_count()} processes, depth {args.depth}: "
+          f"speedup {serial_time / parallel_time:.2f}x, turns and scores agree in {agree}/{args.positions}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import time
+
+from board import Board, BoardAdjacencyIter, encode_turn, decode_turn
+from players import start_board
+
+# Number of turn sequences of each length from start_board() with player 1 to
+# move. A turn that climbs to level 3 ends the game, so it counts as one
+# sequence at its own length and is never extended.
+EXPECTED = {
+    1: 80,
+    2: 6176,
+    3: 426384,
+    4: 29096316,
+}
+
+
+def bitboard_turns(board:Board, pid):
+    """Legal turns of pid from the bitboard generator, Board.iter_turns"""
+    return list(board.iter_turns(pid))
+
+
+def adjacency_turns(board:Board, pid):
+    """Legal turns of pid listed with BoardAdjacencyIter, as Player._list_triples once did"""
+    turns = []
+    workers = board.get_workers(pid)
+    for index in (1, 0):
+        start = workers[index].cord
+        for move in BoardAdjacencyIter(board, start):
+            for build in BoardAdjacencyIter(board, move, False):
+                turns.append(encode_turn(index, move, build))
+            turns.append(encode_turn(index, move, start))
+    return turns
+
+
+# Move generators perft can check against each other
+BACKENDS = {"bitboard": bitboard_turns, "adjacency": adjacency_turns}
+
+
+def _perft(board:Board, pid, depth, generate):
+    if depth == 1:
+        return len(generate(board, pid))
+
+    workers = board.get_workers(pid)
+    count = 0
+    for turn in generate(board, pid):
+        index, move, build = decode_turn(turn)
+        worker = workers[index]
+        start = worker.cord
+        board.move(worker, move)
+        board.build(build)
+        # Climbing to level 3 wins; the game has no further turns
+        if not board.winner:
+            count += _perft(board, 3 - pid, depth - 1, generate)
+        board.unbuild(build)
+        board.move(worker, start)
+    return count
+
+
+def perft(board:Board, pid, depth, backend = "bitboard"):
+    """Counts the turn sequences of length depth starting with pid to move"""
+    if depth == 0:
+        return 1
+    return _perft(board, pid, depth, BACKENDS[backend])
+
+
+def divide(board:Board, pid, depth, backend = "bitboard"):
+    """Returns (turn, count) for every root turn, where count is perft below it"""
+    generate = BACKENDS[backend]
+    workers = board.get_workers(pid)
+    counts = []
+    for turn in generate(board, pid):
+        index, move, build = decode_turn(turn)
+        worker = workers[index]
+        start = worker.cord
+        board.move(worker, move)
+        board.build(build)
+        if depth == 1:
+            counts.append((turn, 1))
+        elif board.winner:
+            counts.append((turn, 0))
+        else:
+            counts.append((turn, _perft(board, 3 - pid, depth - 1, generate)))
+        board.unbuild(build)
+        board.move(worker, start)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count Santorini turn sequences from the start position")
+    parser.add_argument("depth", type=int, help="number of turns")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitboard")
+    parser.add_argument("--divide", action="store_true", help="print the count below each root turn")
+    args = parser.parse_args()
+
+    board = start_board()
+    start_time = time.perf_counter()
+    if args.divide:
+        counts = divide(board, 1, args.depth, args.backend)
+        for turn, count in counts:
+            index, move, build = decode_turn(turn)
+            print(f"{board.get_workers(1)[index].id} {move} {build}: {count}")
+        total = sum(count for turn, count in counts)
+    else:
+        total = perft(board, 1, args.depth, args.backend)
+    elapsed = time.perf_counter() - start_time
+
+    print(f"perft({args.depth}) = {total} in {elapsed * 1000:.0f} ms "
+          f"({total / elapsed if elapsed else 0:.0f} nodes/sec)")
+    expected = EXPECTED.get(args.depth)
+    if expected is not None and expected != total:
+        print(f"MISMATCH: expected {expected}")
+
+
+if __name__ == "__main__":
+    main()
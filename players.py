@@ -1,11 +1,31 @@
 import random
+from itertools import islice
 
-from board import Board, BoardAdjacencyIter, Worker, TurnMemento
+import json
+
+from board import (Board, Worker, TurnMemento, CELLS, CORDS, DEFAULT_WEIGHTS, DISTANCE_OFFSET,
+                   encode_turn, decode_turn)
+from search import AlphaBetaSearch
+from mcts import MonteCarloTreeSearch
+from transposition import TranspositionTable, DEPTH_PREFERRED
+from solver import EndgameSolver, WIN as SOLVED_WIN
 # from memento import TurnMemento
 
 HUMAN = 1
 RANDOM = 2
 HEURISTIC = 3
+ALPHABETA = 4
+MCTS = 5
+
+# Player types that take a time_ms limit per move
+TIMED_TYPES = {ALPHABETA, MCTS}
+
+# Command line names for each player type
+PLAYER_TYPES = {"human": HUMAN, "random": RANDOM, "heuristic": HEURISTIC, "alphabeta": ALPHABETA,
+                "mcts": MCTS}
+
+# Where each player's two workers start
+START_SPACES = {1: ((3,1), (1,3)), 2: ((1,1), (3,3))}
 
 directionDict = {
     # The change in cord for each direction
@@ -19,37 +39,105 @@ directionDict = {
     "nw":(-1,-1)
 }
 
+def format_turn(board:Board, pid, turn, start = None):
+    """
+    Writes an encoded turn of pid as worker,move direction,build direction.
+    start is where the worker stood if the turn has already been played.
+    """
+    index, move_space, build_space = decode_turn(turn)
+    if start is None:
+        start = board.get_workers(pid)[index].cord
+    dir1 = (move_space[0] - start[0], move_space[1] - start[1])
+    dir2 = (build_space[0] - move_space[0], build_space[1] - move_space[1])
+    key1 = list(directionDict.keys())[list(directionDict.values()).index(dir1)]
+    key2 = list(directionDict.keys())[list(directionDict.values()).index(dir2)]
+    return board.get_workers(pid)[index].id + "," + key1 + "," + key2
+
+def parse_turn(board:Board, pid, text):
+    """Reads a format_turn string back into an encoded turn, or None if it is not legal"""
+    try:
+        worker_id, dir_move, dir_build = text.strip().split(",")
+        move = directionDict[dir_move]
+        build = directionDict[dir_build]
+    except (ValueError, KeyError):
+        return None
+    ids = [worker.id for worker in board.get_workers(pid)]
+    if worker_id not in ids:
+        return None
+    worker = board.get_workers(pid)[ids.index(worker_id)]
+    move_space = (worker.cord[0] + move[0], worker.cord[1] + move[1])
+    build_space = (move_space[0] + build[0], move_space[1] + build[1])
+    if move_space not in CELLS or build_space not in CELLS:
+        return None
+    turn = encode_turn(ids.index(worker_id), move_space, build_space)
+    if turn not in board.iter_turns(pid):
+        return None
+    return turn
+
+def load_weights(path):
+    """Reads player options saved by tune.py: {"weights": [c1, c2, c3], "distance_offset": n}"""
+    with open(path) as file:
+        saved = json.load(file)
+    options = {"weights": tuple(saved["weights"])}
+    if "distance_offset" in saved:
+        options["distance_offset"] = saved["distance_offset"]
+    return options
+
+def start_board():
+    """A fresh board with all four workers on their start spaces"""
+    workers = [Worker('A'), Worker('B'), Worker('Y'), Worker('Z')]
+    board = Board(workers)
+    for pid in (1, 2):
+        for worker, cord in zip(board.get_workers(pid), START_SPACES[pid]):
+            board.move(worker, cord)
+    return board
+
 class PlayerFactory:
-    def create_player(self, board, pid, w1, w2, player_type = HUMAN):
-        player_mapping = {HUMAN: HumanPlayer, RANDOM: RandomPlayer, HEURISTIC: HeuristicPlayer}
-        return player_mapping[player_type](board, pid, w1, w2)
+    def create_player(self, board, pid, w1, w2, player_type = HUMAN, **options):
+        player_mapping = {HUMAN: HumanPlayer, RANDOM: RandomPlayer, HEURISTIC: HeuristicPlayer,
+                          ALPHABETA: AlphaBetaPlayer, MCTS: MCTSPlayer}
+        return player_mapping[player_type](board, pid, w1, w2, **options)
 
 class Player:
     """Abstract base class"""
-    def __init__(self, board:Board, pid, w1:Worker, w2:Worker):
+    def __init__(self, board:Board, pid, w1:Worker, w2:Worker, quiet = False, book = None,
+                 endgame_threshold = None, endgame_plies = 4,
+                 weights = DEFAULT_WEIGHTS, distance_offset = DISTANCE_OFFSET):
         
         self._workers = [w1, w2]
         self._board = board
         self._pid = pid
+        # Quiet players never print their moves (headless games)
+        self._quiet = quiet
 
-        if self._pid == 1:
-            board.move(w1, (3,1))
-            board.move(w2, (1,3))
-        else:
-            board.move(w1, (1,1))
-            board.move(w2, (3,3))
+        # c1, c2, c3 of calc_score and the offset of calculate_distance_score
+        self._weights = tuple(weights)
+        self._distance_offset = distance_offset
+
+        # Opening book (an OpeningBook or the path of one) consulted before _input_turn
+        if isinstance(book, str):
+            from openingbook import OpeningBook
+            book = OpeningBook(book)
+        self._book = book
+
+        # With endgame_threshold set, positions with at most that many legal
+        # turns are solved endgame_plies ahead and a proven win is played
+        self._endgame_threshold = endgame_threshold
+        self._solver = None
+        if endgame_threshold is not None:
+            self._solver = EndgameSolver(board, endgame_plies)
+
+        board.move(w1, START_SPACES[pid][0])
+        board.move(w2, START_SPACES[pid][1])
 
     def _check_valid_moves(self):
         """
         Halts execution of the game when the player's workers have no moves
         """
 
-        for worker in self._workers:
-            for cord in BoardAdjacencyIter(self._board, worker.cord):
-                # If any valid adjacent space exists, return without error
-                return
-
-        raise NoValidMoves()
+        # If any valid adjacent space exists, return without error
+        if not self._board.has_turn(self._pid):
+            raise NoValidMoves()
     
     def take_turn(self, _undo_redo):
         """
@@ -58,7 +146,14 @@ class Player:
 
         self._check_valid_moves()
 
-        worker, move_space, build_space = self._input_turn()
+        # Turns are encoded ints (see board.encode_turn) until applied here
+        turn = self._book_turn()
+        if turn is None:
+            turn = self._endgame_turn()
+        if turn is None:
+            turn = self._input_turn()
+        index, move_space, build_space = decode_turn(turn)
+        worker = self._workers[index]
         worker_was_space = worker.cord
 
         self._board.move(worker, move_space)
@@ -67,43 +162,73 @@ class Player:
         if _undo_redo:
             self._board.save(TurnMemento((worker, move_space, build_space, worker_was_space)))
 
+        for hook in self._board.turn_hooks:
+            hook(turn)
+
     def _input_turn(self):
+        """Returns the chosen turn encoded with board.encode_turn"""
         raise NotImplementedError()
 
+    def close(self):
+        """Releases anything held beyond the board (threads, processes) once the game is over"""
+        pass
+
+    def _book_turn(self):
+        """Returns the opening book's turn for this position, or None"""
+        if self._book is None:
+            return None
+        # Keep probing after a miss: undo and jump can bring the game back into the book
+        turn = self._book.probe(self._board, self._pid)
+        if turn is None:
+            return None
+        self._print_move(turn)
+        return turn
+
+    def _endgame_turn(self):
+        """Returns a turn proven to win once few turns are left, or None"""
+        if self._solver is None or self._count_turns() > self._endgame_threshold:
+            return None
+        result, turn, plies = self._solver.solve(self._pid)
+        if result != SOLVED_WIN:
+            return None
+        self._print_move(turn)
+        if not self._quiet:
+            print(f"solved: wins within {plies} turns ({self._solver.nodes} nodes "
+                  f"in {self._solver.elapsed * 1000:.0f} ms)")
+        return turn
+
+    def _iter_turns(self):
+        """Lazily yields every legal turn as an encoded int"""
+        return self._board.iter_turns(self._pid)
+
+    def _count_turns(self):
+        return self._board.count_turns(self._pid)
+
+    def _encode_turn(self, worker, move_space, build_space):
+        return encode_turn(self._workers.index(worker), move_space, build_space)
+
     def _list_triples(self):
-        list1 = self._list_worker_moves(True)
-        list2 = self._list_worker_moves(False)
-        return list1 + list2
-
-    def _list_worker_moves(self, is_w1:bool):
-
-        worker = self._workers[0]
-        if is_w1:
-            worker = self._workers[1]
-
-        start = worker.cord
-        movements = []
-        # Go through all of workers1 valid spaces and save them
-        for move in BoardAdjacencyIter(self._board, start):
-            movements.append((worker.id, move))
-
-        complete = []
-        # Then go through all of the valid movement spaces and find valid build spaces
-        for w, moved in movements:
-            for built in BoardAdjacencyIter(self._board, moved, False):
-                complete.append((w, moved, built))
-            # Edge case: include the tile you were just on as a valid build
-            complete.append((w, moved, start))
-
-        return complete
-
-    def _print_move(self, triple, cord1, cord2):
-        """cord1 and cord2 are the worker's coordinates"""
-        dir1 = (triple[1][0] - cord1, triple[1][1] - cord2)
-        dir2 = (triple[2][0] - triple[1][0], triple[2][1] - triple[1][1])
-        key1 = list(directionDict.keys())[list(directionDict.values()).index(dir1)]
-        key2 = list(directionDict.keys())[list(directionDict.values()).index(dir2)]
-        print(triple[0] + "," + key1 + "," + key2)
+        """
+        Every legal turn as a (worker_id, move_space, build_space) triple, in
+        _iter_turns order. Built directly rather than by decoding turns,
+        which would take twice as long.
+        """
+        board = self._board
+        triples = []
+        for worker in (self._workers[1], self._workers[0]):
+            start = worker.cord
+            for move_space in board.iter_moves(start):
+                for build_space in board.iter_builds(move_space):
+                    triples.append((worker.id, move_space, build_space))
+                # Building on the space just left is always allowed
+                triples.append((worker.id, move_space, start))
+        return triples
+
+    def _print_move(self, turn):
+        """Prints an encoded turn as worker,move direction,build direction"""
+        if self._quiet:
+            return
+        print(format_turn(self._board, self._pid, turn))
 
     def calculate_height(self, cord1, cord2):
         h1 = self._board.get_height(cord1)
@@ -115,7 +240,7 @@ class Player:
 
     def calculate_distance_score(self, cord1, cord2):
         dist = self._board.get_distance_score(self._pid, cord1, cord2)
-        return 8 - dist
+        return self._distance_offset - dist
     
     def get_scores(self, cord1, cord2):
         height_score = self.calculate_height(cord1, cord2)
@@ -125,20 +250,28 @@ class Player:
 
     def calc_score(self, cord1, cord2):
         """Calculate player score"""
-        c1 = 3
-        c2 = 2
-        c3 = 1
-        scores = self.get_scores(cord1, cord2)
+        return self._weigh_scores(self.get_scores(cord1, cord2))
+
+    def calc_move_score(self, worker, cord):
+        """
+        Player score if worker moved to cord. Uses the board's running
+        totals, so it is constant time regardless of the position.
+        """
+        height, center, distance = self._board.get_move_scores(worker, cord)
+        return self._weigh_scores((height, center, self._distance_offset - distance))
+
+    def _weigh_scores(self, scores):
+        c1, c2, c3 = self._weights
         turn_score = c1*scores[0] + c2*scores[1] + c3*scores[2]
         return turn_score
 
 class HumanPlayer(Player):
-    def __init__(self, board, pid, w1, w2):
-        super().__init__(board, pid, w1, w2)
+    def __init__(self, board, pid, w1, w2, **options):
+        super().__init__(board, pid, w1, w2, **options)
 
     def _input_turn(self):
         """
-        Prompts and returns the (worker, move_space, build_space)
+        Prompts and returns the encoded (worker, move_space, build_space)
         """
 
         # Acquire desired worker, move, and build
@@ -146,7 +279,7 @@ class HumanPlayer(Player):
         move_space, relative_move = self.choose_space(worker)
         build_space = self.choose_build(worker, relative_move)
 
-        return (worker, move_space, build_space)
+        return self._encode_turn(worker, move_space, build_space)
 
     def choose_worker(self):
         valid_workers = ["A", "B"]
@@ -218,27 +351,29 @@ class HumanPlayer(Player):
 
 
 class RandomPlayer(Player):
-    def __init__(self, board, pid, w1, w2):
-        super().__init__(board, pid, w1, w2)
+    def __init__(self, board, pid, w1, w2, **options):
+        super().__init__(board, pid, w1, w2, **options)
 
     def _input_turn(self):
         
-        # Full sample space of valid moves
-        triples = self._list_triples()
-        move = triples[random.randint(0,len(triples)-1)]
-
-        worker = self._workers[0]
-        if move[0] == 'B' or move[0] == 'Z':
-            worker = self._workers[1]
+        # Uniform over the full sample space of valid moves, without listing it
+        choice = random.randint(0, self._count_turns()-1)
+        turn = next(islice(self._iter_turns(), choice, None))
 
         # Print to CLI
-        self._print_move(move, worker.cord[0], worker.cord[1])
+        self._print_move(turn)
 
-        return (worker, move[1], move[2])
+        return turn
 
 class HeuristicPlayer(Player):
-    def __init__(self, board, pid, w1, w2):
-        super().__init__(board, pid, w1, w2)
+    def __init__(self, board, pid, w1, w2, vectorized = False, **options):
+        super().__init__(board, pid, w1, w2, **options)
+
+        # Score every candidate in one NumPy call (needs numpy)
+        self._batch_eval = None
+        if vectorized:
+            import batch_eval
+            self._batch_eval = batch_eval
 
     def calculate_height(self, cord1, cord2):
         h1 = self._board.get_height(cord1)
@@ -252,44 +387,152 @@ class HeuristicPlayer(Player):
 
         return h1 + h2
 
-    def _input_turn(self):
-        
-        # Full sample space of all the moves
-        possible_turns = self._list_triples()
+    def calc_move_score(self, worker, cord):
+        # Moving onto level 3 wins the game
+        if self._board.get_height(cord) == 3:
+            return float('inf')
+        return super().calc_move_score(worker, cord)
 
+    def _best_turn(self, possible_turns):
         best_turn_score = 0
-        best_turn = possible_turns[0]
+        best_turn = None
+        scored = None
 
-        # Calculate move_score for each triple
+        # Calculate move_score for each encoded turn
         for turn in possible_turns:
+            if best_turn is None:
+                best_turn = turn
 
-            if turn[0] == 'A' or turn[0] == 'Y':
-                # First coordinate is stored in `turn`
-                cord1 = turn[1]
-
-                # Second coordinate is the other worker
-                cord2 = self._workers[1].cord
-            else:
-                # First coordinate is the other worker
-                cord1 = self._workers[0].cord
-
-                # Second coordinate is stored in turn
-                cord2 = turn[1]
-            
-            turn_score = self.calc_score(cord1, cord2)
+            # Turns sharing a worker and move (the low 6 bits) only differ
+            # in the build, which does not change the score
+            if turn & 63 != scored:
+                scored = turn & 63
+                turn_score = self.calc_move_score(self._workers[turn & 1], CORDS[scored >> 1])
 
             if turn_score > best_turn_score:
                 best_turn_score = turn_score
                 best_turn = turn
 
-        worker = self._workers[0]
-        if best_turn[0] == 'B' or best_turn[0] == 'Z':
-            worker = self._workers[1]
+        return best_turn
+
+    def _input_turn(self):
+
+        if self._batch_eval:
+            # Same choice as _best_turn, with every turn scored at once
+            best_turn = self._batch_eval.best_turn(self._board, self._pid, list(self._iter_turns()),
+                                                   self._weights, self._distance_offset)
+        else:
+            best_turn = self._best_turn(self._iter_turns())
+
+        # Print to CLI
+        self._print_move(best_turn)
+
+        return best_turn
+
+class AlphaBetaPlayer(Player):
+    """
+    Searches `depth` turns ahead with alpha-beta pruning, or deepens
+    iteratively until `time_ms` milliseconds have passed if it is given.
+    Results are kept across turns in a transposition table capped at
+    table_bytes (0 disables it) using the given replacement policy.
+    With processes > 1 the root turns are split across a process pool
+    (see parallel.ParallelSearch), each process with its own table.
+    With ponder set, the opponent's likely replies are searched in the
+    background while it thinks (see ponder.Ponderer).
+    """
+
+    def __init__(self, board, pid, w1, w2, depth = 2, time_ms = None,
+                 table_bytes = 16 * 1024 * 1024, replacement = DEPTH_PREFERRED,
+                 processes = 1, ponder = False, **options):
+        super().__init__(board, pid, w1, w2, **options)
+        self._processes = processes
+        if processes != 1:
+            from parallel import ParallelSearch
+            self._search = ParallelSearch(board, depth, processes, table_bytes, self._weights)
+        else:
+            table = None
+            if table_bytes:
+                table = TranspositionTable(table_bytes, replacement)
+            self._search = AlphaBetaSearch(board, depth, table, self._weights)
+        self._time_ms = time_ms
+
+        self._ponderer = None
+        if ponder:
+            from ponder import Ponderer
+            self._ponderer = Ponderer(pid, depth, time_ms, table_bytes, replacement, self._weights)
+
+    def take_turn(self, _undo_redo):
+        # Free the CPU before thinking, and ponder again once the opponent is to move
+        if self._ponderer is not None:
+            self._ponderer.stop()
+        super().take_turn(_undo_redo)
+        if self._ponderer is not None and self._board.running:
+            self._ponderer.start(self._board)
+
+    def close(self):
+        if self._ponderer is not None:
+            self._ponderer.stop()
+        if self._processes != 1:
+            self._search.close()
+
+    def _pondered_turn(self):
+        """Returns the turn pondered for this position, or None"""
+        if self._ponderer is None or not self._ponderer.pondering:
+            return None
+        pondered = self._ponderer.pondered
+        turn = self._ponderer.lookup(self._board)
+        if not self._quiet:
+            ponderer = self._ponderer
+            outcome = f"hit, saved {ponderer.last_saved * 1000:.0f} ms" if turn is not None else "miss"
+            print(f"ponder {outcome} ({pondered} replies pondered; hit rate {ponderer.hit_rate:.0%}, "
+                  f"{ponderer.saved * 1000:.0f} ms saved over {ponderer.hits + ponderer.misses} turns)")
+        return turn
+
+    def _input_turn(self):
+
+        turn = self._pondered_turn()
+        if turn is not None:
+            self._print_move(turn)
+            return turn
+
+        if self._time_ms is None:
+            (worker, move_space, build_space), score = self._search.search(self._pid)
+        else:
+            (worker, move_space, build_space), score = self._search.search_iterative(self._pid, self._time_ms)
+        turn = self._encode_turn(worker, move_space, build_space)
+
+        # Print to CLI
+        self._print_move(turn)
+        if not self._quiet:
+            print(f"searched {self._search.nodes} nodes to depth {self._search.depth_reached} "
+                  f"in {self._search.elapsed * 1000:.0f} ms ({self._search.nps:.0f} nodes/sec)")
+
+        return turn
+
+class MCTSPlayer(Player):
+    """
+    Monte Carlo Tree Search with UCT selection and random playouts.
+    The budget is `iterations` per turn or `time_ms` milliseconds per turn
+    (whichever runs out first if both are given).
+    """
+
+    def __init__(self, board, pid, w1, w2, iterations = None, time_ms = None,
+                 exploration = 1.4, max_nodes = 500000, **options):
+        super().__init__(board, pid, w1, w2, **options)
+        self._search = MonteCarloTreeSearch(board, iterations, time_ms, exploration, max_nodes)
+
+    def _input_turn(self):
+
+        worker, move_space, build_space = self._search.search(self._pid)
+        turn = self._encode_turn(worker, move_space, build_space)
 
         # Print to CLI
-        self._print_move(best_turn, worker.cord[0], worker.cord[1])
+        self._print_move(turn)
+        if not self._quiet:
+            print(f"ran {self._search.iterations} iterations "
+                  f"({self._search.iterations_per_sec:.0f} iterations/sec)")
 
-        return (worker, best_turn[1], best_turn[2])
+        return turn
 
 class NoValidMoves(Exception):
     """
@@ -0,0 +1,143 @@
+import threading
+import time
+
+from board import Board, Worker, DEFAULT_WEIGHTS, encode_turn
+from search import AlphaBetaSearch, SearchTimeout, evaluate, list_turns, position_key
+from transposition import TranspositionTable, DEPTH_PREFERRED
+
+
+class Ponderer:
+    """
+    Searches pid's answers to the opponent's likely replies while the
+    opponent is thinking. start() copies the board into a private one (as
+    a Board.snapshot) and a daemon thread plays each reply there, best
+    first by evaluate, and searches pid's answer just as the player would.
+    Answers are kept by the position the reply leads to, so lookup() finds
+    the one for the position actually reached and the rest are thrown away.
+    """
+
+    def __init__(self, pid, depth = 2, time_ms = None, table_bytes = 16 * 1024 * 1024,
+                 replacement = DEPTH_PREFERRED, weights = DEFAULT_WEIGHTS, max_replies = None):
+        self._pid = pid
+        self._time_ms = time_ms
+        self._weights = weights
+        self._max_replies = max_replies
+        self._board = Board([Worker('A'), Worker('B'), Worker('Y'), Worker('Z')])
+        table = None
+        if table_bytes:
+            table = TranspositionTable(table_bytes, replacement)
+        self._stop = threading.Event()
+        self._search = AlphaBetaSearch(self._board, depth, table, weights, self._stop)
+        self._thread = None
+        # position_key after a reply -> (packed turn, seconds its search took)
+        self._results = {}
+        self._pondering = False
+        self._stop_latency = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+        self.last_saved = 0.0
+
+    @property
+    def hit_rate(self):
+        if not self.hits + self.misses:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
+
+    @property
+    def pondering(self):
+        """True from start() until the next lookup()"""
+        return self._pondering
+
+    @property
+    def pondered(self):
+        """Number of replies answered so far"""
+        return len(self._results)
+
+    def start(self, board:Board):
+        """Starts pondering board's position, with the opponent to move"""
+        self.stop()
+        self._results = {}
+        self._pondering = True
+        self._board.restore(board.snapshot())
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._ponder, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the thread, keeping the answers found so far"""
+        if self._thread is None:
+            return
+        start_time = time.perf_counter()
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._stop_latency = time.perf_counter() - start_time
+
+    def lookup(self, board:Board):
+        """
+        Returns the pondered turn for board's position, or None. A hit
+        saves the time its search took, less the time stopping took.
+        Either way the other answers are dropped.
+        """
+        if self._thread is not None:
+            self.stop()
+        entry = self._results.get(position_key(board, self._pid))
+        self._results = {}
+        self._pondering = False
+        if entry is None:
+            self.misses += 1
+            return None
+        turn, elapsed = entry
+        self.hits += 1
+        self.last_saved = elapsed - self._stop_latency
+        self.saved += self.last_saved
+        return turn
+
+    def _replies(self):
+        """The opponent's turns, the ones leaving it best placed first"""
+        board = self._board
+        opponent = 3 - self._pid
+        turns = list_turns(board, opponent)
+        # An opponent that can win now leaves nothing to answer
+        if not turns:
+            return []
+
+        scored = []
+        for turn in turns:
+            index, worker, start, move, build = turn
+            board.move(worker, move)
+            board.build(build)
+            scored.append((-evaluate(board, opponent, self._weights), turn))
+            board.unbuild(build)
+            board.move(worker, start)
+        scored.sort(key=lambda pair: pair[0])
+        return [turn for score, turn in scored[:self._max_replies]]
+
+    def _ponder(self):
+        board = self._board
+        workers = board.get_workers(self._pid)
+        for index, worker, start, move, build in self._replies():
+            if self._stop.is_set():
+                return
+            board.move(worker, move)
+            board.build(build)
+            try:
+                # Gridlocked answers are never searched, take_turn ends the game first
+                if board.has_turn(self._pid):
+                    key = position_key(board, self._pid)
+                    if self._time_ms is None:
+                        answer, score = self._search.search(self._pid)
+                    else:
+                        answer, score = self._search.search_iterative(self._pid, self._time_ms)
+                    # An iterative search cut short by stop returns a shallower answer
+                    if self._stop.is_set():
+                        return
+                    own_worker, own_move, own_build = answer
+                    self._results[key] = (encode_turn(workers.index(own_worker), own_move, own_build),
+                                          self._search.elapsed)
+            except SearchTimeout:
+                return
+            finally:
+                board.unbuild(build)
+                board.move(worker, start)
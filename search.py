@@ -0,0 +1,294 @@
+import time
+
+from board import Board, DEFAULT_WEIGHTS, ZOBRIST_SIDE, encode_turn, decode_turn
+from transposition import EXACT, LOWER, UPPER
+
+# Score of a won position; larger than any evaluation the weights can produce
+WIN = 10000
+INF = float('inf')
+
+
+def evaluate(board:Board, pid, weights = DEFAULT_WEIGHTS):
+    """calc_score-style evaluation of pid's workers minus the opponent's"""
+    c1, c2, c3 = weights
+    height, center, distance = board.get_scores(pid)
+    opponent_height, opponent_center, opponent_distance = board.get_scores(3 - pid)
+    return (c1*(height - opponent_height) + c2*(center - opponent_center)
+            + c3*(opponent_distance - distance))
+
+
+def position_key(board:Board, pid):
+    """Zobrist key of the position with pid to move"""
+    if pid == 2:
+        return board.zobrist ^ ZOBRIST_SIDE
+    return board.zobrist
+
+
+def list_turns(board:Board, pid):
+    """
+    Returns (index, worker, start, move, build) for every legal turn of pid in
+    the same order as Player._list_triples, or None if pid can win this turn.
+    index is the worker's position in board.get_workers(pid).
+    """
+    turns = []
+    workers = board.get_workers(pid)
+    for index in (1, 0):
+        worker = workers[index]
+        start = worker.cord
+        for move in board.iter_moves(start):
+            if board.get_height(move) == 3:
+                return None
+            for build in board.iter_builds(move):
+                turns.append((index, worker, start, move, build))
+            turns.append((index, worker, start, move, start))
+    return turns
+
+
+def winning_turn(board:Board, pid):
+    """Returns a (worker, move_space, build_space) climbing to level 3, or None"""
+    for worker in reversed(board.get_workers(pid)):
+        for move in board.iter_moves(worker.cord):
+            if board.get_height(move) == 3:
+                # Build on the space just left, which is always free
+                return (worker, move, worker.cord)
+    return None
+
+
+# Deepest iteration search_iterative will start
+MAX_DEPTH = 64
+
+
+class SearchTimeout(Exception):
+    """Raised inside a search when its deadline has passed"""
+
+
+class AlphaBetaSearch:
+    """
+    Depth-limited negamax search with alpha-beta pruning.
+    Turns are applied to and reverted on the live board with
+    Board.move/build/unbuild, so no board copies are made.
+    An optional TranspositionTable is probed and filled at every node.
+    Setting the optional stop event (a threading.Event) from another
+    thread aborts the search as if its deadline had passed.
+    """
+
+    def __init__(self, board:Board, depth = 2, table = None, weights = DEFAULT_WEIGHTS, stop = None):
+        self._board = board
+        self._depth = depth
+        self._table = table
+        self._weights = weights
+        self._stop = stop
+        self._deadline = None
+        self.nodes = 0
+        self.elapsed = 0.0
+        self.depth_reached = 0
+
+    @property
+    def nps(self):
+        if self.elapsed == 0:
+            return 0.0
+        return self.nodes / self.elapsed
+
+    def _key(self, pid):
+        return position_key(self._board, pid)
+
+    def _list_turns(self, pid, best = -1):
+        """
+        list_turns ordered for search: climbing moves first, preceded by
+        the packed `best` turn if given
+        """
+        board = self._board
+        turns = list_turns(board, pid)
+        if turns is None:
+            return None
+
+        # Try climbing moves first, they are the most likely to cause cutoffs
+        turns.sort(key=lambda turn: board.get_height(turn[3]), reverse=True)
+
+        if best >= 0:
+            index, move, build = decode_turn(best)
+            for i, turn in enumerate(turns):
+                if turn[0] == index and turn[3] == move and turn[4] == build:
+                    turns.insert(0, turns.pop(i))
+                    break
+        return turns
+
+    def _check_deadline(self):
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            raise SearchTimeout()
+        if self._stop is not None and self._stop.is_set():
+            raise SearchTimeout()
+
+    def _negamax(self, pid, depth, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & 127:
+            self._check_deadline()
+
+        table = self._table
+        best_code = -1
+        if table is not None:
+            key = self._key(pid)
+            entry = table.probe(key)
+            if entry is not None:
+                entry_depth, flag, score, best_code = entry
+                if entry_depth >= depth:
+                    if flag == EXACT:
+                        return score
+                    if flag == LOWER and score >= beta:
+                        return score
+                    if flag == UPPER and score <= alpha:
+                        return score
+
+        turns = self._list_turns(pid, best_code)
+
+        # Winning now beats every other line, and sooner wins score higher
+        if turns is None:
+            return WIN + depth
+        # Gridlocked: the side to move loses
+        if not turns:
+            return -WIN - depth
+        if depth == 0:
+            return evaluate(self._board, pid, self._weights)
+
+        board = self._board
+        opponent = 3 - pid
+        original_alpha = alpha
+        best = -INF
+        best_turn = None
+        for turn in turns:
+            index, worker, start, move, build = turn
+            board.move(worker, move)
+            board.build(build)
+            try:
+                score = -self._negamax(opponent, depth - 1, -beta, -alpha)
+            finally:
+                board.unbuild(build)
+                board.move(worker, start)
+
+            if score > best:
+                best = score
+                best_turn = turn
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+
+        if table is not None:
+            flag = EXACT
+            if best <= original_alpha:
+                flag = UPPER
+            elif best >= beta:
+                flag = LOWER
+            table.store(key, depth, flag, best, encode_turn(best_turn[0], best_turn[3], best_turn[4]))
+        return best
+
+    def _root_turns(self, pid):
+        """Ordered root turns, starting a new search generation in the table"""
+        best_code = -1
+        if self._table is not None:
+            self._table.new_search()
+            entry = self._table.probe(self._key(pid))
+            if entry is not None:
+                best_code = entry[3]
+        return self._list_turns(pid, best_code)
+
+    def _search_root(self, pid, turns, depth):
+        """Searches every root turn to depth and returns the best one and its score"""
+        board = self._board
+        best_turn = None
+        alpha = -INF
+        for turn in turns:
+            self._check_deadline()
+            index, worker, start, move, build = turn
+            board.move(worker, move)
+            board.build(build)
+            try:
+                score = -self._negamax(3 - pid, depth - 1, -INF, -alpha)
+            finally:
+                board.unbuild(build)
+                board.move(worker, start)
+
+            if best_turn is None or score > alpha:
+                alpha = score
+                best_turn = turn
+
+        if self._table is not None:
+            self._table.store(self._key(pid), depth, EXACT, alpha,
+                              encode_turn(best_turn[0], best_turn[3], best_turn[4]))
+        return best_turn, alpha
+
+    def search(self, pid):
+        """Returns the best (worker, move_space, build_space) for pid and its score"""
+        self.nodes = 1
+        start_time = time.perf_counter()
+
+        turns = self._root_turns(pid)
+        if turns is None:
+            self.elapsed = time.perf_counter() - start_time
+            return winning_turn(self._board, pid), WIN + self._depth
+
+        best_turn, score = self._search_root(pid, turns, self._depth)
+        self.depth_reached = self._depth
+
+        self.elapsed = time.perf_counter() - start_time
+        return best_turn[1:2] + best_turn[3:], score
+
+    def search_turns(self, pid, codes, depth, time_ms = None):
+        """
+        Searches only the packed root turns in codes, in that order, and
+        returns the best packed turn and its score, or None if time_ms ran
+        out first. Ties go to the earlier turn, as in search.
+        """
+        self.nodes = 1
+        start_time = time.perf_counter()
+        if self._table is not None:
+            self._table.new_search()
+
+        by_code = {encode_turn(turn[0], turn[3], turn[4]): turn
+                   for turn in list_turns(self._board, pid)}
+        if time_ms is not None:
+            self._deadline = start_time + time_ms / 1000
+        try:
+            best_turn, score = self._search_root(pid, [by_code[code] for code in codes], depth)
+        except SearchTimeout:
+            return None
+        finally:
+            self._deadline = None
+            self.elapsed = time.perf_counter() - start_time
+        return encode_turn(best_turn[0], best_turn[3], best_turn[4]), score
+
+    def search_iterative(self, pid, time_ms, max_depth = MAX_DEPTH):
+        """
+        Iterative deepening: searches depth 1, 2, ... until time_ms has passed
+        and returns the best turn of the deepest completed depth and its score.
+        Each depth searches the previous depth's best turn first.
+        """
+        self.nodes = 1
+        start_time = time.perf_counter()
+        self.depth_reached = 0
+
+        turns = self._root_turns(pid)
+        if turns is None:
+            self.elapsed = time.perf_counter() - start_time
+            return winning_turn(self._board, pid), WIN
+
+        # Fall back on the first ordered turn if not even depth 1 completes
+        best_turn, score = turns[0], 0
+        self._deadline = start_time + time_ms / 1000
+        try:
+            for depth in range(1, max_depth + 1):
+                best_turn, score = self._search_root(pid, turns, depth)
+                self.depth_reached = depth
+                turns.remove(best_turn)
+                turns.insert(0, best_turn)
+
+                # A forced win or loss will not change with more depth
+                if abs(score) >= WIN:
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self._deadline = None
+
+        self.elapsed = time.perf_counter() - start_time
+        return best_turn[1:2] + best_turn[3:], score
@@ -0,0 +1,189 @@
+import argparse
+import multiprocessing
+import os
+import random
+import time
+from array import array
+
+from board import Board, Worker, decode_turn
+from gamerecord import GameRecordWriter
+from players import PlayerFactory, PLAYER_TYPES, HUMAN
+
+# --opening-turns help, for every command that plays HeadlessGames
+OPENING_TURNS_HELP = "random turns from each game's seed before the players take over (see HeadlessGame)"
+
+
+class HeadlessGame:
+    """
+    Plays one bot-vs-bot game with no input() and no printing.
+    The first opening_turns turns are picked at random from the seed, so
+    deterministic players still play a different game for every seed.
+    """
+
+    def __init__(self, p1_type, p2_type, seed = None, p1_options = None, p2_options = None,
+                 opening_turns = 0):
+        self._p1_type = PLAYER_TYPES.get(p1_type, p1_type)
+        self._p2_type = PLAYER_TYPES.get(p2_type, p2_type)
+        if HUMAN in (self._p1_type, self._p2_type):
+            raise ValueError("Headless games can only be played between bots")
+
+        self._seed = seed
+        self._opening_turns = opening_turns
+        self._workers = [Worker('A'), Worker('B'), Worker('Y'), Worker('Z')]
+        self._board = Board(self._workers)
+
+        factory = PlayerFactory()
+        self._players = [
+            factory.create_player(self._board, 1, self._workers[0], self._workers[1], self._p1_type,
+                                  quiet=True, **(p1_options or {})),
+            factory.create_player(self._board, 2, self._workers[2], self._workers[3], self._p2_type,
+                                  quiet=True, **(p2_options or {}))]
+        self._turn = 0
+
+        # Every encoded turn played, in order
+        self._turns = array('H')
+        self._board.add_turn_hook(self._turns.append)
+
+    @property
+    def turns(self):
+        return self._turns
+
+    @property
+    def board(self):
+        return self._board
+
+    @property
+    def players(self):
+        return self._players
+
+    def _random_turn(self, pid, rng):
+        board = self._board
+        turn = rng.choice(list(board.iter_turns(pid)))
+        index, move_space, build_space = decode_turn(turn)
+        board.move(board.get_workers(pid)[index], move_space)
+        board.build(build_space)
+        for hook in board.turn_hooks:
+            hook(turn)
+
+    def run(self):
+        """Plays the game to the end and returns (winning pid, number of turns)"""
+        if self._seed is not None:
+            random.seed(self._seed)
+        # A separate generator, so the opening leaves the players' random numbers as they were
+        opening = random.Random(self._seed)
+
+        pid = 1
+        try:
+            while True:
+                # Climbing to level 3 wins; being gridlocked on your turn loses
+                winner = self._board.result(pid)
+                if winner:
+                    return (winner, self._turn)
+                self._turn += 1
+                if self._turn <= self._opening_turns:
+                    self._random_turn(pid, opening)
+                else:
+                    self._players[pid - 1].take_turn(False)
+                pid = 3 - pid
+        finally:
+            for player in self._players:
+                player.close()
+
+
+class SelfPlayResults:
+    """Aggregate results of a batch of headless games"""
+
+    def __init__(self, p1_type, p2_type):
+        self.p1_type = p1_type
+        self.p2_type = p2_type
+        self.wins = {1: 0, 2: 0}
+        self.lengths = []
+        self.elapsed = 0.0
+
+    def add(self, winner, turns):
+        self.wins[winner] += 1
+        self.lengths.append(turns)
+
+    @property
+    def games(self):
+        return len(self.lengths)
+
+    @property
+    def games_per_sec(self):
+        if self.elapsed == 0:
+            return 0.0
+        return self.games / self.elapsed
+
+    @property
+    def mean_length(self):
+        if not self.lengths:
+            return 0.0
+        return sum(self.lengths) / len(self.lengths)
+
+    def __str__(self):
+        return (f"{self.games} games: {self.p1_type} (white) won {self.wins[1]}, "
+                f"{self.p2_type} (blue) won {self.wins[2]}, "
+                f"mean length {self.mean_length:.1f} turns, {self.games_per_sec:.1f} games/sec")
+
+
+def _play_game(task):
+    p1_type, p2_type, seed, p1_options, p2_options, record, opening_turns = task
+    game = HeadlessGame(p1_type, p2_type, seed, p1_options, p2_options, opening_turns)
+    winner, turns = game.run()
+    return winner, turns, game.turns.tobytes() if record else None
+
+
+def run_selfplay(p1_type, p2_type, games, processes = None, seed = 0,
+                 p1_options = None, p2_options = None, record_path = None, opening_turns = 0):
+    """
+    Plays `games` headless games across a process pool and returns SelfPlayResults.
+    Game i is seeded with seed + i, so a run is reproducible for any pool size,
+    and opens with opening_turns random turns (see HeadlessGame).
+    processes = 1 plays every game in this process.
+    If record_path is given, every game is appended to that game record file.
+    """
+    record = record_path is not None
+    tasks = [(p1_type, p2_type, seed + i, p1_options, p2_options, record, opening_turns)
+             for i in range(games)]
+    results = SelfPlayResults(p1_type, p2_type)
+    writer = GameRecordWriter(record_path) if record else None
+
+    def add(outcome):
+        winner, turns, played = outcome
+        results.add(winner, turns)
+        if writer:
+            writer.write_game(PLAYER_TYPES.get(p1_type, p1_type), PLAYER_TYPES.get(p2_type, p2_type),
+                              winner, array('H', played))
+
+    start = time.perf_counter()
+    try:
+        if processes == 1:
+            for outcome in map(_play_game, tasks):
+                add(outcome)
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                chunksize = max(1, games // (4 * (processes or os.cpu_count() or 1)))
+                for outcome in pool.imap(_play_game, tasks, chunksize):
+                    add(outcome)
+    finally:
+        if writer:
+            writer.close()
+    results.elapsed = time.perf_counter() - start
+
+    return results
+
+
+if __name__ == "__main__":
+    bots = [name for name, player_type in PLAYER_TYPES.items() if player_type != HUMAN]
+    parser = argparse.ArgumentParser(description="Run headless bot-vs-bot games")
+    parser.add_argument("p1_type", choices=bots)
+    parser.add_argument("p2_type", choices=bots)
+    parser.add_argument("games", type=int)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", help="append the games to this game record file")
+    parser.add_argument("--opening-turns", type=int, default=0, help=OPENING_TURNS_HELP)
+    args = parser.parse_args()
+
+    print(run_selfplay(args.p1_type, args.p2_type, args.games, args.processes, args.seed,
+                       record_path=args.record, opening_turns=args.opening_turns))
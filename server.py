@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+
+from board import Board, Worker
+from players import (Player, PlayerFactory, PLAYER_TYPES, HUMAN, ALPHABETA, MCTS,
+                     format_turn, parse_turn)
+
+# Line protocol, one command or reply per line:
+#   server: HELLO santorini 1
+#   client: NEW <opponent type> [white|blue]   start a game against a bot (white moves first)
+#   server: GAME <id> <white|blue>
+#   server: BOARD <Board.snapshot in hex>      before every turn
+#   server: TURN <number>                      the client's turn; answer with MOVE
+#   client: MOVE <worker>,<move dir>,<build dir>
+#   server: MOVED <worker>,<move dir>,<build dir>   a turn played by either side
+#   server: ERROR <message>                    the command was refused, try again
+#   client: SHOW                               the board as main.py prints it, lines prefixed "| "
+#   server: WINNER <white|blue>                the game is over; NEW starts another
+#   client: QUIT
+COLORS = {1: "white", 2: "blue"}
+PIDS = {"white": 1, "blue": 2}
+
+# Options for each bot type unless overridden. Every game has its own
+# player, so alpha-beta's transposition table and the MCTS tree are kept small
+BOT_OPTIONS = {ALPHABETA: {"table_bytes": 1 << 20}, MCTS: {"max_nodes": 20000}}
+
+
+class RemotePlayer(Player):
+    """A player whose turns arrive over a connection; submit() before take_turn"""
+
+    def __init__(self, board, pid, w1, w2, **options):
+        super().__init__(board, pid, w1, w2, quiet=True, **options)
+        self._pending = None
+
+    def submit(self, turn):
+        self._pending = turn
+
+    def _input_turn(self):
+        turn, self._pending = self._pending, None
+        return turn
+
+
+class ServerGame:
+    """One game between a remote client and a bot"""
+
+    def __init__(self, game_id, pid, opponent_type, options = None):
+        self.game_id = game_id
+        self.pid = pid
+        self._workers = [Worker('A'), Worker('B'), Worker('Y'), Worker('Z')]
+        self.board = Board(self._workers)
+
+        factory = PlayerFactory()
+        players = {}
+        for player_pid, (w1, w2) in ((1, self._workers[0:2]), (2, self._workers[2:4])):
+            if player_pid == pid:
+                players[player_pid] = RemotePlayer(self.board, player_pid, w1, w2)
+            else:
+                players[player_pid] = factory.create_player(self.board, player_pid, w1, w2,
+                                                            opponent_type, quiet=True,
+                                                            **(options or {}))
+        self.players = players
+        self.to_move = 1
+        self.turn = 0
+        self.winner = None
+
+    def play(self, turn = None):
+        """
+        Plays the turn of the side to move (submitting turn for the remote
+        side) and returns it as format_turn text
+        """
+        player = self.players[self.to_move]
+        if turn is not None:
+            player.submit(turn)
+        starts = [worker.cord for worker in self.board.get_workers(self.to_move)]
+        played = []
+        self.board.add_turn_hook(played.append)
+        try:
+            player.take_turn(False)
+        finally:
+            self.board.remove_turn_hook(played.append)
+
+        text = format_turn(self.board, self.to_move, played[0], starts[played[0] & 1])
+        self.turn += 1
+        self.to_move = 3 - self.to_move
+        self.winner = self.board.result(self.to_move) or None
+        if self.winner is not None:
+            self.close()
+        return text
+
+    def close(self):
+        for player in self.players.values():
+            player.close()
+
+
+class SantoriniServer:
+    """
+    Hosts any number of games on one event loop. Client turns are applied
+    inline; bot turns run on a thread pool so a slow search does not stall
+    the other connections. bot_options maps a bot type to the options its
+    players are created with, on top of BOT_OPTIONS.
+    """
+
+    def __init__(self, bot_threads = None, bot_options = None):
+        self._executor = concurrent.futures.ThreadPoolExecutor(bot_threads)
+        self._bot_options = {player_type: dict(options) for player_type, options in BOT_OPTIONS.items()}
+        for player_type, options in (bot_options or {}).items():
+            self._bot_options.setdefault(player_type, {}).update(options)
+        self._ids = itertools.count(1)
+        self.games = 0
+
+    async def _send(self, writer, line):
+        writer.write((line + "\n").encode())
+        await writer.drain()
+
+    async def _advance(self, game, writer):
+        """Plays bot turns until the client is to move or the game ends, then prompts"""
+        loop = asyncio.get_running_loop()
+        while game.winner is None and game.to_move != game.pid:
+            played = await loop.run_in_executor(self._executor, game.play)
+            await self._send(writer, "MOVED " + played)
+
+        if game.winner is not None:
+            await self._send(writer, f"WINNER {COLORS[game.winner]}")
+            return
+        await self._send(writer, f"BOARD {game.board.snapshot():x}")
+        await self._send(writer, f"TURN {game.turn + 1}")
+
+    async def handle(self, reader, writer):
+        game = None
+        await self._send(writer, "HELLO santorini 1")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command, _, argument = line.decode().strip().partition(" ")
+                command = command.upper()
+
+                if command == "QUIT":
+                    break
+                elif command == "NEW":
+                    if game is not None:
+                        game.close()
+                    game = await self._new_game(argument, writer)
+                elif command == "SHOW" and game is not None:
+                    for row in str(game.board).splitlines():
+                        await self._send(writer, "| " + row)
+                elif command == "MOVE" and game is not None and game.winner is None:
+                    turn = parse_turn(game.board, game.pid, argument)
+                    if turn is None:
+                        await self._send(writer, "ERROR illegal turn")
+                        continue
+                    await self._send(writer, "MOVED " + game.play(turn))
+                    await self._advance(game, writer)
+                else:
+                    await self._send(writer, f"ERROR unexpected {command or 'empty line'}")
+        except ConnectionError:
+            pass
+        finally:
+            if game is not None:
+                game.close()
+            writer.close()
+
+    async def _new_game(self, argument, writer):
+        words = argument.split()
+        if not words or PLAYER_TYPES.get(words[0]) in (None, HUMAN):
+            await self._send(writer, "ERROR NEW needs a bot type: "
+                             + " ".join(name for name, value in PLAYER_TYPES.items() if value != HUMAN))
+            return None
+        color = words[1] if len(words) > 1 else "white"
+        if color not in PIDS:
+            await self._send(writer, "ERROR color must be white or blue")
+            return None
+
+        opponent_type = PLAYER_TYPES[words[0]]
+        game = ServerGame(next(self._ids), PIDS[color], opponent_type, self._bot_options.get(opponent_type))
+        self.games += 1
+        await self._send(writer, f"GAME {game.game_id} {color}")
+        await self._advance(game, writer)
+        return game
+
+
+async def serve(host = "127.0.0.1", port = 7714, unix = None, bot_threads = None, bot_options = None):
+    santorini = SantoriniServer(bot_threads, bot_options)
+    if unix:
+        server = await asyncio.start_unix_server(santorini.handle, unix)
+    else:
+        server = await asyncio.start_server(santorini.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    from tournament import PlayerSpec
+
+    parser = argparse.ArgumentParser(description="Host Santorini games against bots over a line protocol")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7714)
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--bot-threads", type=int, default=None, help="threads running bot turns")
+    parser.add_argument("--bot", type=PlayerSpec.parse, action="append", default=[],
+                        help="options for one bot type as TYPE:key=value,..., e.g. alphabeta:depth=3,"
+                             "table_bytes=4194304 (defaults: alphabeta table_bytes 1 MiB, mcts max_nodes "
+                             "20000 per game); may be repeated")
+    args = parser.parse_args()
+    bot_options = {}
+    for spec in args.bot:
+        bot_options.setdefault(spec.player_type, {}).update(spec.options)
+    asyncio.run(serve(args.host, args.port, args.unix, args.bot_threads, bot_options))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import time
+
+from board import Board, encode_turn
+from search import list_turns, position_key, winning_turn
+
+# Proven results, from the view of the side to move
+WIN = 1
+LOSS = -1
+UNKNOWN = 0
+
+
+class EndgameSolver:
+    """
+    Depth-first AND/OR search that proves whether the side to move can
+    force a win within a number of plies (its own turns and the
+    opponent's), deepening one ply at a time so the quickest win is found.
+    Proven results are kept with the number of plies they were proven in,
+    in a table of at most max_entries positions that forgets its oldest
+    entries first, and are only reused by searches at least that deep.
+    Unproven ones are kept with the depth they were searched to.
+    """
+
+    def __init__(self, board:Board, max_plies = 6, max_entries = 1 << 20):
+        self._board = board
+        self._max_plies = max_plies
+        self._max_entries = max_entries
+        # position_key -> (result, plies proven in or searched to, packed best turn or -1)
+        self._table = {}
+        self.nodes = 0
+        self.elapsed = 0.0
+
+    def __len__(self):
+        return len(self._table)
+
+    def _store(self, key, result, plies, best):
+        table = self._table
+        entry = table.get(key)
+        if entry is None:
+            if len(table) >= self._max_entries:
+                # Dicts keep insertion order, so this is the oldest entry
+                del table[next(iter(table))]
+        elif result == UNKNOWN and entry[0] != UNKNOWN:
+            # A shallow search failing to prove a deeper result does not undo it
+            return
+        table[key] = (result, plies, best)
+
+    def _prove(self, pid, plies):
+        """
+        (WIN, LOSS or UNKNOWN, plies) for pid to move, looking plies turns
+        ahead; a proven result comes with the plies it takes
+        """
+        self.nodes += 1
+        key = position_key(self._board, pid)
+        entry = self._table.get(key)
+        if entry is not None:
+            result, depth, best = entry
+            if result != UNKNOWN and depth <= plies:
+                return result, depth
+            if result == UNKNOWN and depth >= plies:
+                return UNKNOWN, plies
+
+        turns = list_turns(self._board, pid)
+        if turns is None:
+            result, depth, best = WIN, 1, -1
+        elif not turns:
+            # Gridlocked: lost before making a turn
+            result, depth, best = LOSS, 0, -1
+        elif plies <= 1:
+            # Only an immediate win could be proven with one ply left
+            return UNKNOWN, plies
+        else:
+            result, depth, best = self._prove_turns(pid, turns, plies)
+        self._store(key, result, depth, best)
+        return result, depth
+
+    def _prove_turns(self, pid, turns, plies):
+        board = self._board
+        # Climbing turns are the likeliest to win, try them first
+        turns.sort(key=lambda turn: board.get_height(turn[3]), reverse=True)
+
+        result, longest = LOSS, 0
+        for index, worker, start, move, build in turns:
+            board.move(worker, move)
+            board.build(build)
+            try:
+                reply, depth = self._prove(3 - pid, plies - 1)
+            finally:
+                board.unbuild(build)
+                board.move(worker, start)
+            if reply == LOSS:
+                return WIN, depth + 1, encode_turn(index, move, build)
+            if reply == UNKNOWN:
+                result = UNKNOWN
+            else:
+                longest = max(longest, depth + 1)
+        if result == UNKNOWN:
+            return UNKNOWN, plies, -1
+        # Every turn loses; the opponent needs the longest of its wins
+        return LOSS, longest, -1
+
+    def solve(self, pid, max_plies = None):
+        """
+        Returns (result, packed turn, plies) for pid to move: the winning
+        turn if result is WIN and otherwise -1, and the plies the result
+        takes (or was searched to, if UNKNOWN)
+        """
+        self.nodes = 0
+        start_time = time.perf_counter()
+        max_plies = max_plies or self._max_plies
+
+        result, plies = UNKNOWN, 0
+        for depth in range(1, max_plies + 1):
+            result, plies = self._prove(pid, depth)
+            if result != UNKNOWN:
+                break
+
+        best = -1
+        if result == WIN:
+            best = self._table[position_key(self._board, pid)][2]
+            if best < 0:
+                # Won on the spot: climb to level 3
+                worker, move, build = winning_turn(self._board, pid)
+                best = encode_turn(self._board.get_workers(pid).index(worker), move, build)
+        self.elapsed = time.perf_counter() - start_time
+        return result, best, plies
@@ -0,0 +1,96 @@
+from board import Board, CELLS, CORDS, encode_turn, decode_turn
+
+# The 8 symmetries of the 5x5 board as functions of (row, col):
+# rotations by 0, 90, 180 and 270 degrees, then the four reflections
+TRANSFORMS = (
+    lambda y, x: (y, x),
+    lambda y, x: (x, 4 - y),
+    lambda y, x: (4 - y, 4 - x),
+    lambda y, x: (4 - x, y),
+    lambda y, x: (y, 4 - x),
+    lambda y, x: (4 - y, x),
+    lambda y, x: (x, y),
+    lambda y, x: (4 - x, 4 - y),
+)
+
+# CELL_MAPS[t][cell] is where transform t sends cell, INVERSE_MAPS[t] undoes it
+CELL_MAPS = tuple(tuple(CELLS[transform(*cord)] for cord in CORDS) for transform in TRANSFORMS)
+INVERSE_MAPS = tuple(tuple(cell_map.index(cell) for cell in range(25)) for cell_map in CELL_MAPS)
+
+# ROW_MAPS[t][row][bits] is the mask transform t makes of the 5 bits of one board row,
+# so a whole 25-bit mask is transformed with five lookups
+ROW_MAPS = tuple(
+    tuple(tuple(sum(1 << cell_map[row * 5 + x] for x in range(5) if bits >> x & 1)
+                for bits in range(32))
+          for row in range(5))
+    for cell_map in CELL_MAPS)
+
+# Worker slots of each player in a snapshot, and the swap bit of each pair
+PAIRS = ((0, 1), (2, 3))
+UNPLACED = 31
+
+
+def transform_mask(mask, transform):
+    rows = ROW_MAPS[transform]
+    return (rows[0][mask & 31] | rows[1][mask >> 5 & 31] | rows[2][mask >> 10 & 31]
+            | rows[3][mask >> 15 & 31] | rows[4][mask >> 20 & 31])
+
+
+def _key(levels, cells, transform, pid):
+    """Snapshot-layout int of the transformed position and the pair swap bits it needed"""
+    key = 0
+    for level, mask in enumerate(levels):
+        key |= transform_mask(mask, transform) << (25 * level)
+
+    cell_map = CELL_MAPS[transform]
+    swap = 0
+    for pair, (first, second) in enumerate(PAIRS):
+        a = cell_map[cells[first]] if cells[first] != UNPLACED else UNPLACED
+        b = cell_map[cells[second]] if cells[second] != UNPLACED else UNPLACED
+        # Which worker of a pair is which does not matter to the game
+        if b < a:
+            a, b = b, a
+            swap |= 1 << pair
+        key |= a << (100 + 10 * pair) | b << (105 + 10 * pair)
+    return key | (pid - 1) << 120, swap
+
+
+def canonical(board:Board, pid):
+    """
+    Returns (key, transform, swap) for pid to move: key is the same int for
+    every position equivalent under board symmetry and swapping the two
+    workers of a player, transform is the index in TRANSFORMS that maps this
+    board onto the canonical one, and bit pid - 1 of swap is set if pid's
+    workers trade places there. Keys have the Board.snapshot layout plus
+    the side to move at bit 120.
+    """
+    state = board.snapshot()
+    levels = [(state >> (25 * level)) & 0x1ffffff for level in range(4)]
+    cells = [(state >> (100 + 5 * slot)) & 31 for slot in range(4)]
+
+    best = None
+    for transform in range(len(TRANSFORMS)):
+        key, swap = _key(levels, cells, transform, pid)
+        if best is None or key < best[0]:
+            best = (key, transform, swap)
+    return best
+
+
+def canonical_key(board:Board, pid):
+    return canonical(board, pid)[0]
+
+
+def to_canonical(turn, pid, transform, swap):
+    """Maps an encoded turn of pid on the board into the canonical frame"""
+    index, move, build = decode_turn(turn)
+    cell_map = CELL_MAPS[transform]
+    return encode_turn(index ^ (swap >> (pid - 1) & 1),
+                       CORDS[cell_map[CELLS[move]]], CORDS[cell_map[CELLS[build]]])
+
+
+def from_canonical(turn, pid, transform, swap):
+    """Maps an encoded turn of pid in the canonical frame back onto the board"""
+    index, move, build = decode_turn(turn)
+    cell_map = INVERSE_MAPS[transform]
+    return encode_turn(index ^ (swap >> (pid - 1) & 1),
+                       CORDS[cell_map[CELLS[move]]], CORDS[cell_map[CELLS[build]]])
@@ -1,32 +1,529 @@
-# import unittest
+import random
+
 import pytest
-from unittest.mock import patch, Mock
 
-def test_players:
-    
+from board import decode_turn
+from perft import BACKENDS, EXPECTED, divide, perft
+from players import start_board
+
+
+# Deeper entries of the table take too long for the test suite; run perft.py for those
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_perft_start_position(backend, depth):
+    assert perft(start_board(), 1, depth, backend) == EXPECTED[depth]
+
+
+@pytest.mark.parametrize("backend", sorted(BACKENDS))
+def test_divide_sums_to_perft(backend):
+    counts = divide(start_board(), 1, 2, backend)
+    assert len(counts) == EXPECTED[1]
+    assert sum(count for turn, count in counts) == EXPECTED[2]
+
+
+def test_backends_list_the_same_turns():
+    board = start_board()
+    assert BACKENDS["bitboard"](board, 1) == BACKENDS["adjacency"](board, 1)
+
+
+def test_perft_leaves_board_unchanged():
+    board = start_board()
+    before = board.snapshot()
+    perft(board, 1, 2)
+    assert board.snapshot() == before
+
+
+def test_turns_stay_next_to_their_worker():
+    board = start_board()
+    workers = board.get_workers(1)
+    for turn in board.iter_turns(1):
+        index, move, build = decode_turn(turn)
+        start = workers[index].cord
+        assert max(abs(move[0] - start[0]), abs(move[1] - start[1])) == 1
+        assert max(abs(build[0] - move[0]), abs(build[1] - move[1])) == 1
+
+
+def test_win_is_undone_with_the_move():
+    board = start_board()
+    worker = board.get_workers(1)[0]
+    start = worker.cord
+    target = (2, 0)
+    for _ in range(3):
+        board.build(target)
+    board.move(worker, target)
+    assert board.winner == 1 and not board.running
+    assert board.result(2) == 1
+    board.move(worker, start)
+    assert board.winner == 0 and board.running
+
+
+def test_gridlocked_side_to_move_loses():
+    board = start_board()
+    # Dome every space next to player 2's workers
+    for worker in board.get_workers(2):
+        for space in list(board.iter_builds(worker.cord)):
+            for _ in range(4 - board.get_height(space)):
+                board.build(space)
+    assert not board.has_turn(2)
+    assert board.result(2) == 1
+    assert board.running
+
+
+def test_solver_finds_the_winning_climb():
+    from solver import EndgameSolver, WIN
+    board = start_board()
+    for _ in range(2):
+        board.build((2, 0))
+    board.move(board.get_workers(1)[0], (2, 0))
+    for _ in range(3):
+        board.build((1, 0))
+    result, turn, plies = EndgameSolver(board).solve(1)
+    assert (result, plies) == (WIN, 1)
+    assert decode_turn(turn)[1] == (1, 0)
+
+
+def test_solver_reports_the_same_distance_when_solved_again():
+    from solver import EndgameSolver, WIN
+    board = start_board()
+    for worker, cord in zip(board.get_workers(2), ((4, 0), (4, 1))):
+        board.move(worker, cord)
+    board.move(board.get_workers(1)[0], (0, 4))
+    # A stairway the opponent is too far away to dome: step up now, climb next turn
+    for cord, height in (((0, 4), 1), ((0, 3), 2), ((0, 2), 3)):
+        for _ in range(height):
+            board.build(cord)
+    solver = EndgameSolver(board)
+    first = solver.solve(1)
+    assert first[0] == WIN and first[2] == 3
+    assert solver.solve(1) == first
+
+
+def test_ponder_answers_the_reply_played():
+    from ponder import Ponderer
+    from search import AlphaBetaSearch, list_turns
+    board = start_board()
+    ponderer = Ponderer(2, depth=1, table_bytes=0)
+    ponderer.start(board)
+    ponderer._thread.join()
+
+    index, worker, start, move, build = list_turns(board, 1)[5]
+    board.move(worker, move)
+    board.build(build)
+    (answer, move, build), score = AlphaBetaSearch(board, 1).search(2)
+    turn = ponderer.lookup(board)
+    assert decode_turn(turn) == (board.get_workers(2).index(answer), move, build)
+    assert (ponderer.hits, ponderer.misses) == (1, 0)
+
+
+def _recorded_random_game(seed, history, checkpoint_interval):
+    """Plays random turns with undo history on and returns the board and each position's state"""
+    from board import Board, Worker
+    from players import PlayerFactory, RANDOM
+    workers = [Worker('A'), Worker('B'), Worker('Y'), Worker('Z')]
+    board = Board(workers, history, checkpoint_interval)
+    players = [PlayerFactory().create_player(board, pid, workers[2 * pid - 2], workers[2 * pid - 1],
+                                             RANDOM, quiet=True) for pid in (1, 2)]
+    random.seed(seed)
+    states = [(board.snapshot(), board.zobrist, board.get_scores(1), board.get_scores(2))]
+    pid = 1
+    while board.running and board.has_turn(pid):
+        players[pid - 1].take_turn(True)
+        states.append((board.snapshot(), board.zobrist, board.get_scores(1), board.get_scores(2)))
+        pid = 3 - pid
+    return board, states
+
+
+def _state(board):
+    return (board.snapshot(), board.zobrist, board.get_scores(1), board.get_scores(2))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_jump_restores_positions_after_the_history_wraps(seed):
+    board, states = _recorded_random_game(seed, history=8, checkpoint_interval=3)
+    history = board.history
+    assert len(states) - 1 > 8
+    assert history.first_turn == len(states) - 1 - 8
+
+    rng = random.Random(seed)
+    for _ in range(50):
+        turn = rng.randrange(len(states))
+        if turn < history.first_turn:
+            assert not board.jump(turn)
+            continue
+        assert board.jump(turn)
+        assert _state(board) == states[turn]
+        # Stepping one turn either way lands on the neighbouring position
+        if board.undo():
+            assert _state(board) == states[turn - 1]
+            board.redo()
+        assert _state(board) == states[turn]
+
+
+def test_restore_reproduces_a_snapshot():
+    from board import Board, Worker
+    board, states = _recorded_random_game(7, history=64, checkpoint_interval=4)
+    fresh = Board([Worker('A'), Worker('B'), Worker('Y'), Worker('Z')])
+    for state in states:
+        fresh.restore(state[0])
+        assert _state(fresh) == state
+
+
+def _random_positions(count, seed):
+    """(board snapshot, pid to move) of positions from seeded random games"""
+    from board import decode_turn
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = start_board()
+        pid = 1
+        while board.running and board.has_turn(pid) and len(positions) < count:
+            positions.append((board.snapshot(), pid))
+            index, move, build = decode_turn(rng.choice(list(board.iter_turns(pid))))
+            board.move(board.get_workers(pid)[index], move)
+            board.build(build)
+            pid = 3 - pid
+    return positions
+
+
+def _transformed(state, transform, swaps):
+    """A snapshot under a board symmetry, with the workers of the pairs in swaps traded"""
+    from symmetry import CELL_MAPS, transform_mask
+    moved = 0
+    for level in range(4):
+        moved |= transform_mask(state >> (25 * level) & 0x1ffffff, transform) << (25 * level)
+    cells = [CELL_MAPS[transform][state >> (100 + 5 * slot) & 31] for slot in range(4)]
+    for pid in swaps:
+        first = 2 * pid - 2
+        cells[first], cells[first + 1] = cells[first + 1], cells[first]
+    for slot, cell in enumerate(cells):
+        moved |= cell << (100 + 5 * slot)
+    return moved
+
+
+def test_canonical_form_is_symmetry_invariant():
+    from symmetry import TRANSFORMS, canonical, from_canonical, to_canonical
+    board = start_board()
+    for state, pid in _random_positions(200, seed=3):
+        board.restore(state)
+        key, transform, swap = canonical(board, pid)
+        turns = list(board.iter_turns(pid))
+        canonical_turns = {to_canonical(turn, pid, transform, swap) for turn in turns}
+        for turn in turns:
+            assert from_canonical(to_canonical(turn, pid, transform, swap), pid, transform, swap) == turn
+
+        for other in range(len(TRANSFORMS)):
+            for swaps in ((), (1,), (2,), (1, 2)):
+                board.restore(_transformed(state, other, swaps))
+                other_key, other_transform, other_swap = canonical(board, pid)
+                assert other_key == key
+                assert {to_canonical(turn, pid, other_transform, other_swap)
+                        for turn in board.iter_turns(pid)} == canonical_turns
+
+
+def test_game_records_round_trip(tmp_path):
+    from gamerecord import GameRecordReader, GameRecordWriter
+    from selfplay import HeadlessGame
+    path = tmp_path / "games.rec"
+    played = []
+    with GameRecordWriter(path) as writer:
+        for seed in range(5):
+            game = HeadlessGame("heuristic", "random", seed, opening_turns=4)
+            positions = [game.board.snapshot()]
+            game.board.add_turn_hook(lambda turn, board=game.board, positions=positions:
+                                     positions.append(board.snapshot()))
+            winner, turns = game.run()
+            writer.write_game(3, 2, winner, game.turns)
+            played.append((winner, list(game.turns), positions))
+
+    with GameRecordReader(path) as reader:
+        assert len(reader) == len(played)
+        assert reader[-1].turns == reader[len(played) - 1].turns
+        for record, (winner, turns, positions) in zip(reader, played):
+            assert (record.p1_type, record.p2_type, record.winner) == (3, 2, winner)
+            assert list(record.turns) == turns
+            for i, (board, pid, turn) in enumerate(record.replay()):
+                assert board.snapshot() == positions[i]
+                assert pid == 1 + i % 2
+            # The generator plays the last turn after its last yield
+            assert board.snapshot() == positions[-1]
+
+
+def test_incremental_scores_match_calc_score():
+    from selfplay import HeadlessGame
+    game = HeadlessGame("random", "random")
+    board = game.board
+    for state, pid in _random_positions(200, seed=5):
+        board.restore(state)
+        for player in game.players:
+            own = player._pid
+            w1, w2 = board.get_workers(own)
+            height, center, distance = player.get_scores(w1.cord, w2.cord)
+            assert board.get_scores(own) == (height, center, 8 - distance)
+
+        # Scoring a move without making it matches making it and calling calc_score
+        player = game.players[pid - 1]
+        for turn in list(board.iter_turns(pid)):
+            index, move, build = decode_turn(turn)
+            worker = board.get_workers(pid)[index]
+            start = worker.cord
+            expected = player.calc_move_score(worker, move)
+            board.move(worker, move)
+            w1, w2 = board.get_workers(pid)
+            assert player.calc_score(w1.cord, w2.cord) == expected
+            board.move(worker, start)
+
+
+@pytest.mark.parametrize("weights", [(3, 2, 1), (0.5, 0.5, -1), (-1, 2, 0)])
+def test_batch_eval_matches_heuristic_player(weights):
+    import batch_eval
+    from selfplay import HeadlessGame
+    game = HeadlessGame("heuristic", "heuristic", p1_options={"weights": weights},
+                        p2_options={"weights": weights})
+    board = game.board
+    for state, pid in _random_positions(100, seed=9):
+        board.restore(state)
+        player = game.players[pid - 1]
+        turns = list(board.iter_turns(pid))
+        scores = batch_eval.score_turns(board, pid, turns, weights)
+        assert list(scores) == [player.calc_move_score(board.get_workers(pid)[turn & 1],
+                                                       decode_turn(turn)[1]) for turn in turns]
+        assert batch_eval.best_turn(board, pid, turns, weights) == player._best_turn(turns)
+
+    # Whole games pick the same turns either way
+    for seed in range(5):
+        games = [HeadlessGame("heuristic", "random", seed, {"weights": weights, "vectorized": vectorized},
+                              opening_turns=4) for vectorized in (False, True)]
+        for each in games:
+            each.run()
+        assert games[0].turns == games[1].turns
+
+
+def test_server_plays_a_game_over_the_line_protocol(tmp_path):
+    import asyncio
+    from board import Board, Worker
+    from players import format_turn
+    from server import SantoriniServer
+
+    async def play():
+        path = str(tmp_path / "santorini.sock")
+        server = await asyncio.start_unix_server(SantoriniServer(1).handle, path)
+        async with server:
+            reader, writer = await asyncio.open_unix_connection(path)
+
+            async def exchange(line):
+                writer.write((line + "\n").encode())
+                replies = []
+                while not replies or replies[-1].split()[0] not in ("TURN", "ERROR", "WINNER"):
+                    replies.append((await reader.readline()).decode().strip())
+                return replies
+
+            assert (await reader.readline()).decode().strip() == "HELLO santorini 1"
+            assert (await exchange("NEW human"))[-1].startswith("ERROR")
+            replies = await exchange("NEW random blue")
+            assert replies[0] == "GAME 1 blue"
+            board = Board([Worker('A'), Worker('B'), Worker('Y'), Worker('Z')])
+            assert (await exchange("MOVE Y,up,up"))[-1].startswith("ERROR")
+            rng = random.Random(0)
+            while replies[-1].startswith("TURN"):
+                board.restore(int(replies[-2].split()[1], 16))
+                turn = rng.choice(list(board.iter_turns(2)))
+                replies = await exchange("MOVE " + format_turn(board, 2, turn))
+                assert replies[0] == "MOVED " + format_turn(board, 2, turn)
+            assert replies[-1] in ("WINNER white", "WINNER blue")
+            assert (await exchange("MOVE Y,u,u"))[-1].startswith("ERROR")
+            writer.write(b"QUIT\n")
+            assert await reader.readline() == b""
+            writer.close()
+
+    asyncio.run(play())
+
+
+def test_server_bot_options_override_the_defaults():
+    from players import ALPHABETA, MCTS
+    from server import SantoriniServer
+    options = SantoriniServer(1, {MCTS: {"max_nodes": 5000, "iterations": 50}})._bot_options
+    assert options[MCTS] == {"max_nodes": 5000, "iterations": 50}
+    assert options[ALPHABETA] == {"table_bytes": 1 << 20}
+
+
+def test_parallel_search_matches_the_single_process_search():
+    from parallel import ParallelSearch, _random_position
+    from search import AlphaBetaSearch
+    from transposition import TranspositionTable
+    for seed in range(3):
+        board = _random_position(seed, 6)
+        parallel = ParallelSearch(board, 2, processes=2)
+        try:
+            assert parallel.search(1) == AlphaBetaSearch(board, 2, TranspositionTable()).search(1)
+            # The tables are cleared for the next root search, so a repeat gives the same answer
+            assert parallel.search(1) == AlphaBetaSearch(board, 2).search(1)
+        finally:
+            parallel.close()
+
+
+def test_player_spec_parses_names_types_and_literal_options():
+    from players import ALPHABETA, HEURISTIC
+    from tournament import PlayerSpec
+    spec = PlayerSpec.parse("heuristic")
+    assert (spec.name, spec.player_type, spec.options) == ("heuristic", HEURISTIC, {})
+    spec = PlayerSpec.parse("deep=alphabeta:depth=3,weights=(4,2,1),replacement=always")
+    assert (spec.name, spec.player_type) == ("deep", ALPHABETA)
+    assert spec.options == {"depth": 3, "weights": (4, 2, 1), "replacement": "always"}
+    with pytest.raises(ValueError):
+        PlayerSpec.parse("nobody:depth=1")
+
+
+def test_tournament_resumes_without_replaying_recorded_games(tmp_path):
+    from tournament import PlayerSpec, read_results, run_tournament
+    specs = [PlayerSpec.parse("a=random"), PlayerSpec.parse("b=random")]
+    path = str(tmp_path / "results.jsonl")
+    first = run_tournament(specs, 1, path, processes=1)
+    assert len(first) == 2
+    # A crash mid-write leaves a partial line behind
+    with open(path, "a") as file:
+        file.write('{"white": "a", "bl')
+
+    results = run_tournament(specs, 2, path, processes=1)
+    keys = [(result["white"], result["blue"], result["game"]) for result in results]
+    assert sorted(keys) == [("a", "b", 0), ("a", "b", 1), ("b", "a", 0), ("b", "a", 1)]
+    assert results[:2] == first
+    assert read_results(path) == results
+    assert len(run_tournament(specs, 2, path, processes=1)) == 4
+
+
+def test_elo_table_ranks_the_stronger_player_first():
+    from tournament import bradley_terry, elo_table
+    results = []
+    for game in range(10):
+        results.append({"white": "strong", "blue": "weak", "game": game, "winner": 1})
+        results.append({"white": "weak", "blue": "strong", "game": game, "winner": 2 if game < 8 else 1})
+        results.append({"white": "strong", "blue": "middle", "game": game, "winner": 1 if game < 7 else 2})
+        results.append({"white": "middle", "blue": "weak", "game": game, "winner": 1 if game < 7 else 2})
+    rows = elo_table(results, samples=50)
+    assert [row[0] for row in rows] == ["strong", "middle", "weak"]
+    for name, played, score, elo, low, high in rows:
+        assert low < elo < high
+    assert abs(sum(row[3] for row in rows)) < 1e-6
+    assert bradley_terry([], {}) == {} and elo_table([]) == []
+
+
+def test_opening_book_plays_the_searched_turn_and_its_mirror_images(tmp_path):
+    from board import encode_turn
+    from openingbook import OpeningBook, build_from_search, write_book
+    from search import AlphaBetaSearch
+    from symmetry import TRANSFORMS, canonical
+    from transposition import TranspositionTable
+    board = start_board()
+    (worker, move, build), score = AlphaBetaSearch(board, 1, TranspositionTable()).search(1)
+    searched = encode_turn(board.get_workers(1).index(worker), move, build)
+
+    path = str(tmp_path / "plain.book")
+    write_book(path, build_from_search(1, depth=1))
+    with OpeningBook(path) as book:
+        assert len(book) == 1
+        assert book.probe(board, 1) == searched
+        assert book.probe(board, 2) is None
+
+    path = str(tmp_path / "symmetric.book")
+    write_book(path, build_from_search(2, depth=1, width=2, symmetric=True), symmetric=True)
+    mirrored = start_board()
+    with OpeningBook(path) as book:
+        # The start position and the reply to the book's first turn
+        board = start_board()
+        for pid in (1, 2):
+            state = board.snapshot()
+            turn = book.probe(board, pid)
+            assert turn is not None
+            index, move, build = decode_turn(turn)
+            board.move(board.get_workers(pid)[index], move)
+            board.build(build)
+            # A mirror image may itself be symmetric, so the turns need only lead to equivalent positions
+            reached = canonical(board, 3 - pid)[0]
+            for transform in range(len(TRANSFORMS)):
+                for swaps in ((), (pid,)):
+                    mirrored.restore(_transformed(state, transform, swaps))
+                    index, move, build = decode_turn(book.probe(mirrored, pid))
+                    mirrored.move(mirrored.get_workers(pid)[index], move)
+                    mirrored.build(build)
+                    assert canonical(mirrored, 3 - pid)[0] == reached
+
+
+def test_cli_records_the_game_as_played_after_undos(tmp_path, monkeypatch, capsys):
+    import itertools
+    from gamerecord import GameRecordReader
+    from main import BoardCLI
+    random.seed(0)
+    choices = itertools.chain(["next"] * 4 + ["undo", "undo", "redo", "next", "undo", "next"],
+                              itertools.repeat("next"))
+    monkeypatch.setattr("builtins.input", lambda prompt = "": next(choices))
+    path = str(tmp_path / "cli.rec")
+    cli = BoardCLI("random", "heuristic", "on", record=path)
+    cli.run()
+    capsys.readouterr()
+
+    with GameRecordReader(path) as reader:
+        assert len(reader) == 1
+        record = reader[0]
+    assert (record.p1_type, record.p2_type) == (2, 3)
+    assert len(record) == cli._board.history.turn
+    for board, pid, turn in record.replay():
+        pass
+    assert board.snapshot() == cli._board.snapshot()
+    assert record.winner == cli._board.winner
+
 
-# mocking raw input
-# https://stackoverflow.com/questions/21046717/python-mocking-raw-input-in-unittests
+def test_transposition_table_round_trips_and_caps_its_size():
+    from transposition import ENTRY_BYTES, EXACT, LOWER, TranspositionTable
+    table = TranspositionTable(1000)
+    # The largest power of two number of entries that fits
+    assert len(table) == 32 and 32 * ENTRY_BYTES <= 1000 < 64 * ENTRY_BYTES
+    assert len(TranspositionTable(64 * ENTRY_BYTES)) == 64
 
-# def test_enigma_encipher(enigma):
-    # # check bad input
-    # with pytest.raises(ValueError):
-    #     enigma.encipher('?')
+    key = 0x123456789abcdef0
+    assert table.probe(key) is None
+    table.store(key, 3, LOWER, 1.1, 517)
+    assert table.probe(key) == (3, LOWER, 1.1, 517)
+    # A key landing on the same slot does not read another position's entry
+    assert table.probe(key + len(table)) is None
+    table.store(key, 2, EXACT, -4.0, 12)
+    assert table.probe(key) == (2, EXACT, -4.0, 12)
+    table.clear()
+    assert table.probe(key) is None
 
-    # # check bad input 2
-    # with pytest.raises(TypeError):
-    #     enigma.encipher(100)
 
-    # assert enigma.encipher("CHILL") == "QUPCN"
-    # assert enigma.encipher("c  h i ll") == "HRKPO"
-    # assert enigma.encipher("") == ""
+@pytest.mark.parametrize("policy", ["depth", "always"])
+def test_transposition_table_replacement(policy):
+    from transposition import EXACT, TranspositionTable
+    table = TranspositionTable(1000, policy)
+    key, other = 5, 5 + len(table)
+    table.store(key, 4, EXACT, 1.0, 1)
+    # A shallower result for another position in this search only replaces it when always replacing
+    table.store(other, 2, EXACT, 2.0, 2)
+    if policy == "depth":
+        assert table.probe(key) == (4, EXACT, 1.0, 1) and table.probe(other) is None
+        table.store(other, 5, EXACT, 3.0, 3)
+        assert table.probe(other) == (5, EXACT, 3.0, 3)
+    else:
+        assert table.probe(other) == (2, EXACT, 2.0, 2) and table.probe(key) is None
 
-    # with patching
-    # with patch.object(enigma, "encode_decode_letter") as edl:
-    #     edl.return_value = "x"
+    # Entries from an earlier search give way to any new result
+    table.store(key, 6, EXACT, 4.0, 4)
+    table.new_search()
+    table.store(other, 1, EXACT, 5.0, 5)
+    assert table.probe(other) == (1, EXACT, 5.0, 5) and table.probe(key) is None
 
-    #     assert enigma.encipher("") == ""
-    #     edl.assert_not_called()
 
-    #     assert enigma.encipher(" h ") == "x"
-    #     edl.assert_called_with("H")
\ No newline at end of file
+def test_iterative_search_stops_on_time_and_restores_the_board():
+    from board import encode_turn
+    from parallel import _random_position
+    from search import AlphaBetaSearch
+    from transposition import TranspositionTable
+    board = _random_position(0, 6)
+    state, key = board.snapshot(), board.zobrist
+    search = AlphaBetaSearch(board, 2, TranspositionTable())
+    (worker, move, build), score = search.search_iterative(1, 100)
+    # Cut short by the deadline, not by running out of depth
+    assert 0.09 <= search.elapsed < 0.2
+    assert search.depth_reached >= 1
+    assert board.snapshot() == state and board.zobrist == key
+    assert encode_turn(board.get_workers(1).index(worker), move, build) in board.iter_turns(1)
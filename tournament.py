@@ -0,0 +1,246 @@
+import argparse
+import ast
+import json
+import math
+import multiprocessing
+import random
+
+from players import PLAYER_TYPES
+from selfplay import HeadlessGame, OPENING_TURNS_HELP
+
+
+class PlayerSpec:
+    """
+    A named player configuration, written NAME=TYPE:key=value,key=value.
+    NAME= and the options are optional, e.g. "heuristic" or "deep=alphabeta:depth=3".
+    Values are Python literals where they parse as one, so tuples such as
+    weights=(4,2,1) keep their commas.
+    """
+
+    def __init__(self, name, player_type, options = None):
+        self.name = name
+        self.player_type = player_type
+        self.options = options or {}
+
+    @classmethod
+    def parse(cls, text):
+        name = text
+        head = text.split(":", 1)[0]
+        if "=" in head:
+            name, text = text.split("=", 1)
+        type_name, _, option_text = text.partition(":")
+        if type_name not in PLAYER_TYPES:
+            raise ValueError(f"unknown player type {type_name!r}")
+
+        options = {}
+        for item in filter(None, _split_options(option_text)):
+            key, _, value = item.partition("=")
+            try:
+                options[key] = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                options[key] = value
+        return cls(name, PLAYER_TYPES[type_name], options)
+
+
+def _split_options(text):
+    """Splits text on the commas that are not inside brackets"""
+    items = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(text):
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    items.append(text[start:])
+    return items
+
+
+def schedule(specs, games, seed = 0):
+    """
+    Every (white, blue, game) of a round robin in which each ordered pair
+    plays `games` games, so each pairing plays 2 * games with both colors.
+    Game k of every pairing uses seed + k. Games are interleaved across
+    pairings so a partial run still covers all of them.
+    """
+    pairs = [(white, blue) for white in specs for blue in specs if white is not blue]
+    return [(white, blue, game, seed + game) for game in range(games) for white, blue in pairs]
+
+
+def _play(task):
+    white, blue, game, seed, opening_turns = task
+    winner, turns = HeadlessGame(white.player_type, blue.player_type, seed,
+                                 white.options, blue.options, opening_turns).run()
+    return {"white": white.name, "blue": blue.name, "game": game, "seed": seed,
+            "winner": winner, "turns": turns}
+
+
+def read_results(path):
+    """Results recorded so far; a line cut short by a crash is ignored"""
+    results = []
+    try:
+        with open(path) as file:
+            for line in file:
+                try:
+                    results.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return results
+
+
+def run_tournament(specs, games, path, processes = None, seed = 0, opening_turns = 4):
+    """
+    Plays every scheduled game not already in the results file at path,
+    appending each result as one JSON line as soon as it is finished.
+    Each game opens with opening_turns random turns (see HeadlessGame).
+    Returns all results, old and new.
+    """
+    results = read_results(path)
+    done = {(result["white"], result["blue"], result["game"]) for result in results}
+    tasks = [task + (opening_turns,) for task in schedule(specs, games, seed)
+             if (task[0].name, task[1].name, task[2]) not in done]
+
+    with open(path, "a") as file:
+        # A crash may have cut the last line short; start on a fresh one
+        if file.tell() and not _ends_with_newline(path):
+            file.write("\n")
+
+        def append(result):
+            file.write(json.dumps(result) + "\n")
+            file.flush()
+            results.append(result)
+
+        if processes == 1:
+            for result in map(_play, tasks):
+                append(result)
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                for result in pool.imap_unordered(_play, tasks):
+                    append(result)
+    return results
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as file:
+        file.seek(-1, 2)
+        return file.read(1) == b"\n"
+
+
+def _win_counts(results):
+    """{(winner name, loser name): games} over all results"""
+    wins = {}
+    for result in results:
+        if result["winner"] == 1:
+            pair = (result["white"], result["blue"])
+        else:
+            pair = (result["blue"], result["white"])
+        wins[pair] = wins.get(pair, 0) + 1
+    return wins
+
+
+def bradley_terry(names, wins, prior = 0.5, iterations = 1000, tolerance = 1e-9):
+    """
+    Fits Bradley-Terry strengths with the MM algorithm and returns Elo
+    ratings centred on 0. `prior` virtual wins are added to both sides
+    of every pairing so a player who never loses keeps a finite rating.
+    """
+    if not names:
+        return {}
+    games = {}
+    won = {name: 0.0 for name in names}
+    for (winner, loser), count in wins.items():
+        games[winner, loser] = games.get((winner, loser), 0) + count
+        games[loser, winner] = games.get((loser, winner), 0) + count
+        won[winner] += count
+    for pair in games:
+        games[pair] += 2 * prior
+        won[pair[0]] += prior
+
+    strength = {name: 1.0 for name in names}
+    for _ in range(iterations):
+        updated = {}
+        for name in names:
+            denominator = sum(count / (strength[a] + strength[b])
+                              for (a, b), count in games.items() if a == name)
+            updated[name] = won[name] / denominator if denominator else strength[name]
+        # Strengths are only defined up to a common factor
+        scale = math.exp(sum(math.log(value) for value in updated.values()) / len(names))
+        updated = {name: value / scale for name, value in updated.items()}
+        change = max(abs(math.log(updated[name] / strength[name])) for name in names)
+        strength = updated
+        if change < tolerance:
+            break
+
+    return {name: 400 * math.log10(strength[name]) for name in names}
+
+
+def elo_table(results, samples = 200, seed = 0, prior = 0.5):
+    """
+    Returns (name, games, score, elo, low, high) rows sorted by Elo, where
+    low..high is a 95% interval from a bootstrap of each pairing's results.
+    Pairings are resampled at their win rate smoothed by the same prior as
+    bradley_terry, so a pairing one side always won still varies.
+    """
+    names = sorted({result["white"] for result in results} | {result["blue"] for result in results})
+    wins = _win_counts(results)
+    elo = bradley_terry(names, wins, prior)
+
+    rng = random.Random(seed)
+    pairs = {tuple(sorted(pair)) for pair in wins}
+    draws = {name: [] for name in names}
+    for _ in range(samples):
+        resampled = {}
+        for a, b in pairs:
+            played = wins.get((a, b), 0) + wins.get((b, a), 0)
+            p = (wins.get((a, b), 0) + prior) / (played + 2 * prior)
+            a_wins = sum(rng.random() < p for _ in range(played))
+            resampled[a, b] = a_wins
+            resampled[b, a] = played - a_wins
+        for name, rating in bradley_terry(names, resampled, prior).items():
+            draws[name].append(rating)
+
+    rows = []
+    for name in names:
+        played = sum(count for pair, count in wins.items() if name in pair)
+        score = sum(count for (winner, loser), count in wins.items() if winner == name)
+        ratings = sorted(draws[name])
+        low = ratings[int(0.025 * (samples - 1))]
+        high = ratings[int(0.975 * (samples - 1))]
+        rows.append((name, played, score / played if played else 0.0, elo[name], low, high))
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Round-robin tournament between player configurations")
+    parser.add_argument("results", help="append-only JSON lines results file; rerun to resume")
+    parser.add_argument("players", nargs="*", type=PlayerSpec.parse,
+                        help="NAME=TYPE:key=value,... e.g. random heuristic deep=alphabeta:depth=3")
+    parser.add_argument("--games", type=int, default=100, help="games per pairing and color")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--samples", type=int, default=200, help="bootstrap samples for the intervals")
+    parser.add_argument("--opening-turns", type=int, default=4, help=OPENING_TURNS_HELP)
+    args = parser.parse_args()
+
+    names = [spec.name for spec in args.players]
+    if len(set(names)) != len(names):
+        parser.error("player names must be unique")
+    if args.players:
+        results = run_tournament(args.players, args.games, args.results, args.processes, args.seed,
+                                 args.opening_turns)
+    else:
+        results = read_results(args.results)
+
+    print(f"{'player':20}{'games':>8}{'score':>8}{'elo':>8}   95% interval")
+    for name, played, score, elo, low, high in elo_table(results, args.samples, args.seed):
+        print(f"{name:20}{played:8}{score:8.1%}{elo:8.0f}   {low:.0f} .. {high:.0f}")
+
+
+if __name__ == "__main__":
+    main()
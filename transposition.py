@@ -0,0 +1,89 @@
+from array import array
+
+# Bound stored with an entry's score
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Replacement policies
+DEPTH_PREFERRED = "depth"
+ALWAYS_REPLACE = "always"
+
+# key (8) + score (8) + move (4) + depth (1) + flag (1) + generation (1)
+ENTRY_BYTES = 23
+
+
+class TranspositionTable:
+    """
+    Fixed-size hash table of search results keyed on Board.zobrist.
+    Entries live in preallocated parallel arrays, so memory never grows
+    past max_bytes however long the table is used.
+    """
+
+    def __init__(self, max_bytes = 16 * 1024 * 1024, policy = DEPTH_PREFERRED):
+        if policy not in (DEPTH_PREFERRED, ALWAYS_REPLACE):
+            raise ValueError(f"Unknown replacement policy {policy}")
+
+        # Largest power of two number of entries that fits in max_bytes
+        size = 1
+        while size * 2 * ENTRY_BYTES <= max_bytes:
+            size *= 2
+        self._mask = size - 1
+        self._policy = policy
+
+        self._keys = array('Q', bytes(8 * size))
+        # Scores are floats once evaluation weights are fractional; float64 gives
+        # back exactly the score stored, where float32 would round it
+        self._scores = array('d', bytes(8 * size))
+        self._moves = array('i', bytes(4 * size))
+        self._depths = array('b', b'\xff' * size)
+        self._flags = array('B', bytes(size))
+        self._generations = array('B', bytes(size))
+        self._generation = 0
+
+        self.probes = 0
+        self.hits = 0
+
+    def __len__(self):
+        return self._mask + 1
+
+    @property
+    def hit_rate(self):
+        if self.probes == 0:
+            return 0.0
+        return self.hits / self.probes
+
+    def new_search(self):
+        """Marks existing entries as stale so a new turn's results can replace them"""
+        self._generation = (self._generation + 1) & 0xff
+
+    def clear(self):
+        size = len(self)
+        self._keys = array('Q', bytes(8 * size))
+        self._depths = array('b', b'\xff' * size)
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        """Returns (depth, flag, score, move) stored for key, or None"""
+        self.probes += 1
+        index = key & self._mask
+        if self._keys[index] != key or self._depths[index] < 0:
+            return None
+        self.hits += 1
+        return (self._depths[index], self._flags[index], self._scores[index], self._moves[index])
+
+    def store(self, key, depth, flag, score, move):
+        index = key & self._mask
+        if (self._policy == DEPTH_PREFERRED and self._keys[index] != key
+                and self._generations[index] == self._generation
+                and self._depths[index] > depth):
+            # Keep the deeper result from this search
+            return
+
+        self._keys[index] = key
+        self._depths[index] = depth
+        self._flags[index] = flag
+        self._scores[index] = score
+        self._moves[index] = move
+        self._generations[index] = self._generation
@@ -0,0 +1,169 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+
+from board import DEFAULT_WEIGHTS, DISTANCE_OFFSET
+from players import PLAYER_TYPES, HEURISTIC
+from selfplay import _play_game, OPENING_TURNS_HELP
+
+
+class WeightTuner:
+    """
+    SPSA tuning of the (c1, c2, c3) calc_score weights. Each step perturbs
+    every weight by +-c_k at once and scores both perturbed vectors by
+    their win rate against a reference player using the default weights,
+    over the same seeded games (both colors), each opening with
+    opening_turns random turns (see HeadlessGame). The difference moves
+    the weights along the perturbation. Scores are cached per weight
+    vector, in memory and optionally in a JSON file, so repeated vectors
+    and restarted runs cost no games. The file records the settings the
+    scores were measured under and is refused if they differ.
+    """
+
+    def __init__(self, player_type = HEURISTIC, options = None, games = 50, processes = None,
+                 seed = 0, cache_path = None, reference_weights = DEFAULT_WEIGHTS, opening_turns = 4):
+        self._player_type = PLAYER_TYPES.get(player_type, player_type)
+        self._options = options or {}
+        self._games = games
+        self._processes = processes or os.cpu_count() or 1
+        self._seed = seed
+        self._opening_turns = opening_turns
+        self._reference = dict(self._options, weights=tuple(reference_weights))
+        # Everything a cached score depends on besides the weights, as it reads back from JSON
+        self._settings = json.loads(json.dumps({
+            "player_type": self._player_type, "options": self._options, "games": games,
+            "seed": seed, "reference": self._reference, "opening_turns": opening_turns}))
+        self._cache_path = cache_path
+        self._cache = {}
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path) as file:
+                saved = json.load(file)
+            if saved.get("settings") != self._settings:
+                raise ValueError(f"{cache_path} holds scores measured with other settings: "
+                                 f"{saved.get('settings')}")
+            self._cache = {tuple(entry["weights"]): entry["score"] for entry in saved["scores"]}
+        self._pool = None
+        self.games_played = 0
+
+    def __enter__(self):
+        if self._processes != 1:
+            self._pool = multiprocessing.Pool(self._processes)
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._save_cache()
+
+    def _save_cache(self):
+        if self._cache_path:
+            with open(self._cache_path, "w") as file:
+                json.dump({"settings": self._settings,
+                           "scores": [{"weights": list(weights), "score": score}
+                                      for weights, score in self._cache.items()]}, file)
+
+    def _tasks(self, weights):
+        candidate = dict(self._options, weights=weights)
+        tasks = []
+        for i in range(self._games):
+            seed = self._seed + i
+            tasks.append((self._player_type, self._player_type, seed, candidate, self._reference, False,
+                          self._opening_turns))
+            tasks.append((self._player_type, self._player_type, seed, self._reference, candidate, False,
+                          self._opening_turns))
+        return tasks
+
+    def score(self, *vectors):
+        """Win rates of each weight vector against the reference, played together on the pool"""
+        vectors = [tuple(round(weight, 3) for weight in weights) for weights in vectors]
+        missing = [weights for weights in dict.fromkeys(vectors) if weights not in self._cache]
+
+        tasks = [task for weights in missing for task in self._tasks(weights)]
+        if self._pool is None:
+            outcomes = list(map(_play_game, tasks))
+        else:
+            outcomes = self._pool.map(_play_game, tasks, max(1, len(tasks) // (4 * self._processes)))
+        self.games_played += len(tasks)
+
+        per_vector = 2 * self._games
+        for i, weights in enumerate(missing):
+            wins = 0
+            for j, (winner, turns, played) in enumerate(outcomes[i * per_vector:(i + 1) * per_vector]):
+                # Even tasks have the candidate as white, odd ones as blue
+                wins += winner == (1 if j % 2 == 0 else 2)
+            self._cache[weights] = wins / per_vector
+        return [self._cache[weights] for weights in vectors]
+
+    def tune(self, iterations = 50, start = DEFAULT_WEIGHTS, a = 2.0, c = 0.5,
+             alpha = 0.602, gamma = 0.101, low = 0.0, high = 20.0, log = print):
+        """
+        Runs SPSA from start and returns (best weights seen, its score).
+        a and c scale the step and perturbation sizes, which shrink as
+        a / (k + 1 + iterations / 10) ** alpha and c / (k + 1) ** gamma.
+        Weights are kept within [low, high].
+        """
+        rng = random.Random(self._seed)
+        theta = [float(weight) for weight in start]
+        stability = iterations / 10
+        best = (tuple(theta), self.score(theta)[0])
+
+        for k in range(iterations):
+            a_k = a / (k + 1 + stability) ** alpha
+            c_k = c / (k + 1) ** gamma
+            delta = [rng.choice((-1, 1)) for _ in theta]
+            plus = [min(high, max(low, w + c_k * d)) for w, d in zip(theta, delta)]
+            minus = [min(high, max(low, w - c_k * d)) for w, d in zip(theta, delta)]
+            score_plus, score_minus = self.score(plus, minus)
+
+            theta = [min(high, max(low, w + a_k * (score_plus - score_minus) / (2 * c_k * d)))
+                     for w, d in zip(theta, delta)]
+            for weights, score in ((plus, score_plus), (minus, score_minus)):
+                if score > best[1]:
+                    best = (tuple(round(weight, 3) for weight in weights), score)
+            log(f"step {k + 1}: weights {tuple(round(w, 3) for w in theta)}, "
+                f"+ {score_plus:.3f} / - {score_minus:.3f}, best {best[1]:.3f} at {best[0]}")
+            self._save_cache()
+        return best
+
+
+def save_weights(path, weights, score = None, distance_offset = DISTANCE_OFFSET):
+    """Writes weights in the format players.load_weights reads"""
+    with open(path, "w") as file:
+        json.dump({"weights": list(weights), "distance_offset": distance_offset, "score": score},
+                  file, indent=2)
+
+
+def main():
+    from tournament import PlayerSpec
+
+    parser = argparse.ArgumentParser(description="Tune calc_score weights with SPSA self-play")
+    parser.add_argument("output", help="JSON file for the best weights (load with main.py --weights=)")
+    parser.add_argument("--player", type=PlayerSpec.parse, default=PlayerSpec.parse("heuristic"),
+                        help="player type and options to tune, e.g. alphabeta:depth=1")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--games", type=int, default=50, help="seeded games per color per weight vector")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", help="JSON file caching the score of every weight vector tried")
+    parser.add_argument("--opening-turns", type=int, default=4, help=OPENING_TURNS_HELP)
+    parser.add_argument("--start", type=float, nargs=3, default=DEFAULT_WEIGHTS, metavar=("C1", "C2", "C3"))
+    args = parser.parse_args()
+
+    try:
+        tuner = WeightTuner(args.player.player_type, args.player.options, args.games, args.processes,
+                            args.seed, args.cache, opening_turns=args.opening_turns)
+    except ValueError as error:
+        parser.error(str(error))
+    with tuner:
+        weights, score = tuner.tune(args.iterations, args.start)
+    save_weights(args.output, weights, score)
+    print(f"best weights {weights} won {score:.1%} against {DEFAULT_WEIGHTS}; "
+          f"{tuner.games_played} games played, saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()